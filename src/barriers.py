@@ -0,0 +1,176 @@
+import math
+import numpy as np
+import constants as con
+from grid import test_bits
+from rays import ray_map
+
+
+class BarrierMap:
+    """Static barrier geometry of a world, built once when the world is set up.
+
+    Holds the barrier cells as sorted flat indices, a bitmask with one bit per cell for
+    membership tests, and the number of free cells before every barrier, which turns a
+    random rank into a free cell with one binary search instead of scanning or rejecting.
+    The per-direction distances to the next barrier live in the ray map install() builds.
+    """
+
+    def __init__(self, shape: tuple[int, int], barrier_y: np.ndarray, barrier_x: np.ndarray):
+        self.shape = tuple(shape)
+        height, width = self.shape
+        self.cells = np.unique(np.asarray(barrier_y, dtype=np.int64) * width + np.asarray(barrier_x, dtype=np.int64))
+        self.y, self.x = np.divmod(self.cells, width)
+        self.bitmask = np.zeros((height, -(-width // 8)), dtype=np.uint8)
+        np.bitwise_or.at(self.bitmask, (self.y, self.x >> 3), (0x80 >> (self.x & 7)).astype(np.uint8))
+        self._free_before = self.cells - np.arange(len(self.cells))
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    @property
+    def free_count(self) -> int:
+        return self.shape[0] * self.shape[1] - len(self.cells)
+
+    def contains(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Whether every (x, y) is a barrier cell"""
+        return test_bits(self.bitmask, x, y)
+
+    def free_cell(self, rank: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(x, y) of the free cells with the given ranks in row-major order, 0 <= rank < free_count"""
+        cell = rank + np.searchsorted(self._free_before, rank, side="right")
+        y, x = np.divmod(cell, self.shape[1])
+        return x, y
+
+
+def _rectangles(rectangles) -> tuple[np.ndarray, np.ndarray]:
+    # (y, x) of every cell of the (top, bottom, left, right) rectangles, bottom and right excluded
+    cells = [np.mgrid[top:bottom, left:right].reshape(2, -1) for top, bottom, left, right in rectangles]
+    cells = np.concatenate(cells, axis=1) if cells else np.empty((2, 0), dtype=np.int64)
+    return cells[0], cells[1]
+
+
+def walls(shape: tuple[int, int], random: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    # Three vertical walls three quarters of the height long, hanging alternately from the top
+    # and the bottom edge so the way across zigzags
+    height, width = shape
+    thickness, length = max(1, width // 200), height * 3 // 4
+    rectangles = []
+    for index, fraction in enumerate((1, 2, 3)):
+        left = width * fraction // 4 - thickness // 2
+        top = 0 if index % 2 == 0 else height - length
+        rectangles.append((top, top + length, left, left + thickness))
+    return _rectangles(rectangles)
+
+
+def maze(shape: tuple[int, int], random: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    # A perfect maze carved by a random depth-first search, corridors a twentieth of the
+    # world wide separated by walls a quarter of that thick
+    height, width = shape
+    corridor = max(4, min(height, width) // 20)
+    thickness = max(1, corridor // 4)
+    rows, columns = max(1, height // corridor), max(1, width // corridor)
+    # Open passages towards +x and +y of every maze cell
+    east, south = np.zeros((rows, columns), dtype=bool), np.zeros((rows, columns), dtype=bool)
+    visited = np.zeros((rows, columns), dtype=bool)
+    visited[0, 0] = True
+    stack = [(0, 0)]
+    while stack:
+        row, column = stack[-1]
+        neighbors = [
+            (row + dy, column + dx) for dy, dx in ((-1, 0), (1, 0), (0, -1), (0, 1))
+            if 0 <= row + dy < rows and 0 <= column + dx < columns and not visited[row + dy, column + dx]
+        ]
+        if not neighbors:
+            stack.pop()
+            continue
+        next_row, next_column = neighbors[random.integers(len(neighbors))]
+        if next_row != row:
+            south[min(row, next_row), column] = True
+        else:
+            east[row, min(column, next_column)] = True
+        visited[next_row, next_column] = True
+        stack.append((next_row, next_column))
+
+    # A wall on the east and south side of every maze cell unless the passage is open
+    rectangles = []
+    for row in range(rows):
+        for column in range(columns):
+            top, left = row * height // rows, column * width // columns
+            bottom, right = (row + 1) * height // rows, (column + 1) * width // columns
+            if column < columns - 1 and not east[row, column]:
+                rectangles.append((top, bottom, right - thickness, right))
+            if row < rows - 1 and not south[row, column]:
+                rectangles.append((bottom - thickness, bottom, left, right))
+    return _rectangles(rectangles)
+
+
+def islands(shape: tuple[int, int], random: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    # Round islands of barrier scattered at random, covering about a tenth of the world
+    height, width = shape
+    radius = max(2, min(height, width) // 40)
+    count = max(1, int(0.1 * height * width / (math.pi * radius * radius)))
+    offset_y, offset_x = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    disk = offset_x * offset_x + offset_y * offset_y <= radius * radius
+    offset_y, offset_x = offset_y[disk], offset_x[disk]
+    center_y, center_x = random.integers(height, size=count), random.integers(width, size=count)
+    y, x = (center_y[:, None] + offset_y).reshape(-1), (center_x[:, None] + offset_x).reshape(-1)
+    inside = (y >= 0) & (y < height) & (x >= 0) & (x < width)
+    return y[inside], x[inside]
+
+
+# Barrier layouts generated for any world size, function((height, width), generator) -> (y, x)
+PRESETS = {
+    "walls": walls,
+    "maze": maze,
+    "islands": islands,
+}
+
+
+def read_mask(path: str) -> np.ndarray:
+    """2D mask of a file, set where a PNG image is dark or a NPY array is nonzero; NPY files are
+    mapped rather than read"""
+    if path.endswith(".npy"):
+        mask = np.load(path, mmap_mode="r")
+    else:
+        from PIL import Image  # Only needed for image masks
+        with Image.open(path) as image:
+            mask = np.asarray(image.convert("L")) < 128
+    if mask.ndim != 2:
+        raise ValueError(f"{path} is not a 2D mask")
+    return mask
+
+
+def load_mask(path: str, shape: tuple[int, int]) -> tuple[np.ndarray, np.ndarray]:
+    """(y, x) of the set cells of a mask file (see read_mask) scaled to shape"""
+    mask = read_mask(path)
+    # Nearest neighbor scaling, row by row so a mapped file is read once
+    height, width = shape
+    columns = np.arange(width) * mask.shape[1] // width
+    rows = np.arange(height) * mask.shape[0] // height
+    barrier_y, barrier_x = [], []
+    for y, source in enumerate(rows):
+        x = np.flatnonzero(np.asarray(mask[source])[columns])
+        barrier_y.append(np.full(len(x), y))
+        barrier_x.append(x)
+    return np.concatenate(barrier_y).astype(np.int64), np.concatenate(barrier_x).astype(np.int64)
+
+
+def build_barriers(shape: tuple[int, int], layout: str = None) -> BarrierMap:
+    """BarrierMap of layout (by default BARRIERS in constants): None for no barriers, a name
+    in PRESETS, or the path of a mask file"""
+    layout = con.BARRIERS if layout is None else layout
+    if not layout:
+        barrier_y = barrier_x = np.empty(0, dtype=np.int64)
+    elif layout in PRESETS:
+        barrier_y, barrier_x = PRESETS[layout](shape, np.random.default_rng(con.BARRIER_SEED))
+    else:
+        barrier_y, barrier_x = load_mask(layout, shape)
+    return BarrierMap(shape, barrier_y, barrier_x)
+
+
+def install(grid, barriers: BarrierMap):
+    """Write the barriers into an empty occupancy grid and make them the world's barrier map and
+    barrier rays"""
+    grid[barriers.y, barriers.x] = con.BARRIER_CELL
+    con.BARRIER_MAP = barriers
+    con.BARRIER_RAYS = ray_map(grid)
+    con.BARRIER_RAYS.mark(barriers.x, barriers.y)
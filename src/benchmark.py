@@ -0,0 +1,271 @@
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import numpy as np
+import constants as con
+import world
+from simulation import Simulation
+
+# World and population sizes the benchmarks run at
+SCALES = {
+    "small": {"DIM_X": 128, "DIM_Y": 128, "POP_SIZE": 1000},
+    "medium": {"DIM_X": 512, "DIM_Y": 512, "POP_SIZE": 5000},
+    "large": {"DIM_X": 1000, "DIM_Y": 1000, "POP_SIZE": 10000},
+}
+SEED = 1234
+# Results of a reference run, written with --output, that --baseline compares against by
+# default. Timings only compare on the same hardware, so refresh it on the machine that
+# checks for regressions: python benchmark.py --output benchmark_baseline.json
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+# Steps of a generation in the generations/minute benchmark
+GENERATION_STEPS = 100
+# Organisms in the graph brain benchmarks, which step through Python objects
+GRAPH_POPULATION = 200
+
+# Registered benchmarks, name -> (function(simulation) -> (callable to time, units per call), scales, unit)
+BENCHMARKS = {}
+
+
+def benchmark(name: str, scales=("medium",), unit: str = None):
+    """Register function(simulation) as a benchmark run at every scale in scales. The function
+    prepares whatever it needs inside the simulation and returns the callable to time and how
+    many units (organisms, steps, ...) one call processes, for the rate reported next to the time."""
+    def register(function):
+        BENCHMARKS[name] = (function, scales, unit)
+        return function
+    return register
+
+
+def _graph_simulation() -> Simulation:
+    # A small world of graph brains, next to the simulation being benchmarked
+    graph = Simulation(SEED, BRAIN_MODE="graph", DIM_X=128, DIM_Y=128, POP_SIZE=GRAPH_POPULATION)
+    graph.populate()
+    return graph
+
+
+@benchmark("genome.decode", unit="genome")
+def bench_decode(simulation):
+    from genome import decode, random_genomes
+    genomes = random_genomes(con.POP_SIZE, np.random.default_rng(SEED))
+    return (lambda: decode(genomes)), len(genomes)
+
+
+@benchmark("brain.compile", unit="genome")
+def bench_compile(simulation):
+    from brain import BRAIN_CACHE, CompiledBrains
+    genomes = simulation.population.genomes
+
+    def run():
+        BRAIN_CACHE.clear()  # Every genome compiled, as in the first generation
+        CompiledBrains(genomes)
+    return run, len(genomes)
+
+
+@benchmark("brain.compile_cached", unit="genome")
+def bench_compile_cached(simulation):
+    from brain import CompiledBrains
+    genomes = simulation.population.genomes
+    CompiledBrains(genomes)
+    return (lambda: CompiledBrains(genomes)), len(genomes)
+
+
+@benchmark("brain.evaluate", unit="organism")
+def bench_evaluate(simulation):
+    from brain import SENSORY
+    brains = simulation.population.brains
+    sensors = np.random.default_rng(SEED).random((len(brains), len(SENSORY)), dtype=np.float32)
+    return (lambda: brains.evaluate(sensors)), len(brains)
+
+
+@benchmark("sensing.compute_sensors", unit="organism")
+def bench_compute_sensors(simulation):
+    from sensing import compute_sensors
+    population = simulation.population
+    uses_sensor = population.brains.uses_sensor[population.brains.brain]
+    return (lambda: compute_sensors(population, con.WORLD_MATRIX, uses_sensor)), len(population)
+
+
+@benchmark("organism.init", scales=("small",), unit="organism")
+def bench_organism_init(simulation):
+    # Graph brain wiring is what Organism.__init__ spends its time on
+    from population import Population
+    graph = _graph_simulation()
+    genomes = graph.population.genomes
+
+    def run():
+        with graph:
+            Population(genomes, np.zeros(len(genomes)), np.zeros(len(genomes)))
+    return run, len(genomes)
+
+
+@benchmark("organism.process_brain", scales=("small",), unit="organism")
+def bench_process_brain(simulation):
+    graph = _graph_simulation()
+
+    def run():
+        with graph:
+            for organism in graph.population.organisms:
+                organism.process_brain()
+    return run, len(graph.population)
+
+
+@benchmark("sensing_node.compute_output", scales=("small",), unit="sensor")
+def bench_compute_output(simulation):
+    graph = _graph_simulation()
+    with graph:
+        nodes = [node for organism in graph.population.organisms for node in organism.neurons["sensory"].values()]
+
+    def run():
+        with graph:
+            for node in nodes:
+                node.compute_output()
+    return run, len(nodes)
+
+
+@benchmark("world.simulate_world", scales=tuple(SCALES), unit="step")
+def bench_simulate_world(simulation):
+    return world.simulate_world, 1
+
+
+@benchmark("world.breed_next_generation", unit="generation")
+def bench_breed(simulation):
+    return world.breed_next_generation, 1
+
+
+@benchmark("render.full", unit="frame")
+def bench_render_full(simulation):
+    from render import Renderer
+    renderer = Renderer(cell_scale=1, size=(con.DIM_X, con.DIM_Y))
+
+    def run():
+        renderer.frame = None
+        renderer.render(con.POPULATION, con.WORLD_MATRIX)
+    return run, 1
+
+
+@benchmark("render.dirty", unit="frame")
+def bench_render_dirty(simulation):
+    # The usual video frame: redraw only what moved during one step
+    from render import Renderer
+    renderer = Renderer(cell_scale=1, size=(con.DIM_X, con.DIM_Y))
+    renderer.render(con.POPULATION, con.WORLD_MATRIX)
+
+    def run():
+        world.simulate_world()
+        renderer.render(con.POPULATION, con.WORLD_MATRIX)
+    return run, 1
+
+
+@benchmark("generation", scales=tuple(SCALES), unit="generation")
+def bench_generation(simulation):
+    # A whole generation of GENERATION_STEPS steps, survival filtering and breeding
+    con.STEPS_PER_GEN = GENERATION_STEPS
+
+    def run():
+        world.start_generation()
+        for _ in range(con.STEPS_PER_GEN):
+            world.simulate_world()
+        world.filter_surviving_creatures()
+    return run, 1
+
+
+def time_calls(function, repeat: int, min_time: float) -> list[float]:
+    """Seconds per call of function over repeat rounds, each round calling it until
+    min_time has passed"""
+    function()  # Warm up caches and lazy imports
+    timings = []
+    for _ in range(repeat):
+        calls, started = 0, time.perf_counter()
+        while True:
+            function()
+            calls += 1
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_time:
+                break
+        timings.append(elapsed / calls)
+    return timings
+
+
+def run_benchmarks(pattern: str = "*", scales=None, repeat: int = 5, min_time: float = 0.2) -> dict:
+    """Run the benchmarks whose name matches pattern, at their scales (or only the given
+    ones), and return their results keyed by "name[scale]" """
+    results = {}
+    for name, (function, benchmark_scales, unit) in BENCHMARKS.items():
+        if not fnmatch.fnmatch(name, pattern):
+            continue
+        for scale in benchmark_scales:
+            if scales is not None and scale not in scales:
+                continue
+            simulation = Simulation(SEED, **SCALES[scale])
+            simulation.populate()
+            with simulation:
+                run, count = function(simulation)
+                timings = time_calls(run, repeat, min_time)
+            simulation.close()
+            seconds = statistics.median(timings)
+            results[f"{name}[{scale}]"] = {
+                "seconds": seconds,
+                "min_seconds": min(timings),
+                "repeat": repeat,
+                "unit": unit,
+                "per_second": count / seconds if seconds > 0 else None,
+                "per_minute": 60 * count / seconds if seconds > 0 else None,
+                "scale": SCALES[scale],
+            }
+            print(f"{name}[{scale}]: {seconds * 1e3:.3f} ms ({count / seconds:,.1f} {unit}s/s)", file=sys.stderr)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Names of the benchmarks more than threshold (0.2 = 20%) slower than in baseline"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["seconds"] / baseline[name]["seconds"]
+        verdict = "REGRESSION" if ratio > 1 + threshold else "ok"
+        print(f"{name}: {ratio:.2f}x baseline {verdict}", file=sys.stderr)
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simulator's hot paths")
+    parser.add_argument("--only", default="*", help="glob of the benchmark names to run")
+    parser.add_argument("--scale", action="append", choices=SCALES, help="only run at this scale, can be repeated")
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds each round lasts at least")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", nargs="?", const=BASELINE, help="JSON results to compare against (benchmark_baseline.json next to this script when no file is given)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown over the baseline counted as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.only, args.scale, args.repeat, args.min_time)
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": SEED,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file)["results"], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
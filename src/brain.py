@@ -0,0 +1,214 @@
+from collections import OrderedDict
+import numpy as np
+import constants as con
+from genome import decode
+
+SENSORY = con.NEURON_TYPES["sensory"]
+INTERNAL = con.NEURON_TYPES["internal"]
+ACTION = con.NEURON_TYPES["action"]
+
+
+class CompiledBrains:
+    """Dense weight tensors for a whole population, evaluated in one batched pass per step.
+
+    Repeated connections between the same pair of neurons add up, and internal->internal
+    connections carry the internal activations of the previous step.
+
+    Organisms carrying the same genome share one compiled brain: the _LAYOUT fields hold one
+    read-only row per distinct genome, in the order the genomes first appear, brain maps
+    every organism to its row, and only the internal activations are kept per organism.
+    When every genome differs, brain is the identity and the rows are used as they are.
+    """
+
+    def __init__(self, genomes: np.ndarray):
+        # Every distinct genome is compiled once, or taken from BRAIN_CACHE
+        genomes = np.asarray(genomes, dtype=np.uint32)
+        flat = np.zeros((0, _LAYOUT_SIZE), dtype=np.float32)
+        self.brain = np.zeros(len(genomes), dtype=np.intp)
+        if len(genomes):
+            first, self.brain = _first_use(genomes)
+            flat = np.stack(BRAIN_CACHE.lookup("compiled", genomes[first], _compile))
+        start = 0
+        for name, shape, dtype in _LAYOUT:
+            size = int(np.prod(shape))
+            field = flat[:, start:start + size].reshape(len(flat), *shape).astype(dtype, copy=False)
+            field.flags.writeable = False
+            setattr(self, name, field)
+            start += size
+        self.internal = np.zeros((len(genomes), len(INTERNAL)), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.internal)
+
+    def __getitem__(self, mask):
+        # Only the compiled brains some organism of the subset still carries are kept, so
+        # there are never more of them than organisms
+        subset = object.__new__(CompiledBrains)
+        brain = self.brain[mask]
+        first, subset.brain = _first_use(brain) if len(brain) else (brain, brain)
+        for name, _, _ in _LAYOUT:
+            field = getattr(self, name)[brain[first]]
+            field.flags.writeable = False
+            setattr(subset, name, field)
+        subset.internal = self.internal[mask]
+        return subset
+
+    def evaluate(self, sensors: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """Run every brain once on the (population, sensory) input matrix, return the
+        (population, action) matrix of raw action sums. With rows, only those brains run
+        and sensors holds just their inputs."""
+        sensors = sensors.astype(np.float32, copy=False)
+        rows = slice(None) if rows is None else rows
+        brain = rows if len(self.has_action) == len(self.brain) else self.brain[rows]
+        internal = np.tanh(
+            np.einsum("ns,nsi->ni", sensors, self.sensory_internal[brain])
+            + np.einsum("nj,nji->ni", self.internal[rows], self.internal_internal[brain])
+        )
+        self.internal[rows] = internal
+        return np.einsum("ns,nsa->na", sensors, self.sensory_action[brain]) + np.einsum(
+            "ni,nia->na", internal, self.internal_action[brain]
+        )
+
+
+def _first_use(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Index of the first row of every distinct row of keys, in the order they appear, and the
+    # position of every row's among them; arange for both when all rows differ
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.reshape(-1)]
+
+
+# Fields of a compiled brain, stored one after the other in one float32 row per genome
+_LAYOUT = (
+    ("sensory_internal", (len(SENSORY), len(INTERNAL)), np.float32),
+    ("internal_internal", (len(INTERNAL), len(INTERNAL)), np.float32),
+    ("internal_action", (len(INTERNAL), len(ACTION)), np.float32),
+    ("sensory_action", (len(SENSORY), len(ACTION)), np.float32),
+    ("has_action", (len(ACTION),), bool),
+    ("uses_sensor", (len(SENSORY),), bool),
+)
+_LAYOUT_SIZE = sum(int(np.prod(shape)) for _, shape, _ in _LAYOUT)
+
+
+def _compile(genomes: np.ndarray) -> list[np.ndarray]:
+    # One flat _LAYOUT row per genome
+    count = len(genomes)
+    source_type, source_id, sink_type, sink_id, weight = decode(genomes)
+    tensors = {name: np.zeros((count, *shape), dtype=np.float32) for name, shape, _ in _LAYOUT[:4]}
+
+    rows = np.broadcast_to(np.arange(count)[:, None], source_type.shape)
+    connected = {}
+    for name, from_internal, to_action in (
+        ("sensory_internal", 0, 0),
+        ("internal_internal", 1, 0),
+        ("internal_action", 1, 1),
+        ("sensory_action", 0, 1),
+    ):
+        genes = (source_type == from_internal) & (sink_type == to_action)
+        index = (rows[genes], source_id[genes], sink_id[genes])
+        np.add.at(tensors[name], index, weight[genes])
+        connected[from_internal, to_action] = np.zeros(tensors[name].shape, dtype=bool)
+        connected[from_internal, to_action][index] = True
+
+    # Action neurons exist when any gene targets them, even with a zero weight
+    tensors["has_action"] = connected[1, 1].any(axis=1) | connected[0, 1].any(axis=1)
+
+    # Internal neurons that feed an action, directly or through other internal neurons
+    live_internal = connected[1, 1].any(axis=2)
+    for _ in range(len(INTERNAL)):
+        live_internal = live_internal | (connected[1, 0] & live_internal[:, None, :]).any(axis=2)
+    # Sensors whose value can reach an action neuron, the rest never need computing
+    tensors["uses_sensor"] = connected[0, 1].any(axis=2) | (
+        connected[0, 0] & live_internal[:, None, :]
+    ).any(axis=2)
+
+    flat = np.concatenate([tensors[name].reshape(count, -1) for name, _, _ in _LAYOUT], axis=1, dtype=np.float32)
+    # Rows are copied so evicting an entry frees it, and read-only as they are shared
+    rows = [row.copy() for row in flat]
+    for row in rows:
+        row.flags.writeable = False
+    return rows
+
+
+def wiring(genome: np.ndarray) -> tuple[tuple, tuple]:
+    """(neurons, connections) of the neuron graph of one genome, shared by every organism
+    carrying it: neurons are (type, name) in the order they are created, connections
+    (source type, source, sink type, sink, weight) with repeated pairs added up"""
+    return BRAIN_CACHE.lookup("graph", np.asarray(genome, dtype=np.uint32)[None], _wire)[0]
+
+
+def _wire(genomes: np.ndarray) -> list[tuple]:
+    types = (("sensory", "internal"), ("internal", "action"))
+    wirings = []
+    for genome in genomes:
+        # Connections grouped by sink, in gene order
+        inputs = {}
+        for source_type, source_id, sink_type, sink_id, weight in zip(*(f.tolist() for f in decode(genome))):
+            source = (types[0][source_type], con.NEURON_TYPES[types[0][source_type]][source_id])
+            sink = (types[1][sink_type], con.NEURON_TYPES[types[1][sink_type]][sink_id])
+            sources = inputs.setdefault(sink, {})
+            sources[source] = sources.get(source, 0.0) + weight
+
+        # Neurons reachable backwards from the action neurons, breadth first
+        neurons = [sink for sink in inputs if sink[0] == "action"]
+        created = set(neurons)
+        connections = []
+        for sink in neurons:  # Grows while it is walked
+            for source, weight in inputs.get(sink, {}).items():
+                if source not in created:
+                    created.add(source)
+                    neurons.append(source)
+                connections.append((*source, *sink, weight))
+        wirings.append((tuple(neurons), tuple(connections)))
+    return wirings
+
+
+class BrainCache:
+    """Bounded table of decoded brains keyed by genome, the least recently used dropped first.
+
+    Children mostly carry the exact genome of a parent or a sibling, so every distinct genome
+    is decoded once and its entry, never modified, is shared by all the organisms carrying it.
+    hits and misses count the genomes looked up; entries are dropped whenever the settings
+    genomes are decoded with change.
+    """
+
+    def __init__(self, size: int = None):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._settings = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, kind: str, genomes: np.ndarray, build) -> list:
+        """Entries of kind for every genome row, build(genomes) returning the missing ones"""
+        settings = (con.LENGTH_GENE, con.ID_BITS_COUNT, con.WEIGHT_SCALING_FACTOR, tuple(con.NEURON_TYPES.items()))
+        if settings != self._settings:
+            self.entries.clear()
+            self._settings = settings
+        keys = [(kind, genome.tobytes()) for genome in np.ascontiguousarray(genomes)]
+        values = [self.entries.get(key) for key in keys]
+        missing = [index for index, value in enumerate(values) if value is None]
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+        for key, value in zip(keys, values):
+            if value is not None:
+                self.entries.move_to_end(key)
+        if missing:
+            for index, value in zip(missing, build(genomes[missing])):
+                values[index] = self.entries[keys[index]] = value
+        size = con.BRAIN_CACHE_SIZE if self.size is None else self.size
+        while len(self.entries) > size:
+            self.entries.popitem(last=False)
+        return values
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+
+BRAIN_CACHE = BrainCache()
@@ -0,0 +1,111 @@
+import numpy as np
+import constants as con
+from genome import GENE_BITS, GENE_MASK
+
+
+def select_uniform(count: int, fitness: np.ndarray, random: np.random.Generator) -> np.ndarray:
+    """Every parent is equally likely to be picked"""
+    return random.integers(len(fitness), size=count)
+
+
+def select_fitness_weighted(count: int, fitness: np.ndarray, random: np.random.Generator) -> np.ndarray:
+    """Parents are picked with probability proportional to their fitness"""
+    # Draws are scaled by the last cumulative weight, not by sum(), which rounds differently
+    # and could land past the end
+    cumulative = np.cumsum(np.asarray(fitness, dtype=np.float64))
+    if len(cumulative) == 0 or cumulative[-1] <= 0:
+        return select_uniform(count, fitness, random)
+    return np.searchsorted(cumulative, random.random(count) * cumulative[-1], side="right")
+
+
+def select_tournament(count: int, fitness: np.ndarray, random: np.random.Generator) -> np.ndarray:
+    """Each parent is the fittest of TOURNAMENT_SIZE randomly drawn candidates"""
+    candidates = random.integers(len(fitness), size=(count, con.TOURNAMENT_SIZE))
+    winners = np.argmax(np.asarray(fitness)[candidates], axis=1)
+    return candidates[np.arange(count), winners]
+
+
+# Selection strategies by name; any function(count, fitness, random) -> parent indices can be used
+# instead, random being the numpy Generator to draw from
+SELECTION_STRATEGIES = {
+    "uniform": select_uniform,
+    "fitness": select_fitness_weighted,
+    "tournament": select_tournament,
+}
+# Strategies that only make sense with the actual fitness of the parents
+FITNESS_STRATEGIES = ("fitness", "tournament")
+# Rounds of redrawing the second parent of pairs that picked the same one twice
+MAX_REDRAWS = 32
+
+
+def select_parents(count: int, fitness: np.ndarray, selection, random: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """Pick count pairs of distinct parents; a pair keeps the same parent twice only when
+    MAX_REDRAWS redraws did not give another one, as when a single parent has any fitness.
+    All-zero fitness counts as uniform."""
+    fitness = np.asarray(fitness, dtype=np.float64)
+    if len(fitness) < 2:
+        raise ValueError("Breeding needs at least two parents")
+    if not np.all(np.isfinite(fitness)) or np.any(fitness < 0):
+        raise ValueError("Fitness must be finite and non-negative")
+    if not fitness.any():
+        fitness = np.ones(len(fitness))
+    select = SELECTION_STRATEGIES[selection] if isinstance(selection, str) else selection
+    first, second = select(count, fitness, random), select(count, fitness, random)
+    same = np.flatnonzero(first == second)
+    for _ in range(MAX_REDRAWS):
+        if len(same) == 0:
+            break
+        second[same] = select(len(same), fitness, random)
+        same = same[first[same] == second[same]]
+    return first, second
+
+
+def crossover(first: np.ndarray, second: np.ndarray, random: np.random.Generator) -> np.ndarray:
+    """Single point crossover of two genome matrices, row by row: the bits before a random
+    point come from first, the rest from second"""
+    count, length = first.shape
+    gene, bit = np.divmod(random.integers(1, GENE_BITS * length, size=count), GENE_BITS)
+    gene, bit = gene[:, None], bit[:, None].astype(np.uint32)
+
+    # Mask of the bits taken from the second parent
+    positions = np.arange(length)[None, :]
+    split = (np.uint32(1) << (np.uint32(GENE_BITS) - bit)) - np.uint32(1)
+    from_second = np.where(positions > gene, np.uint32(GENE_MASK), np.where(positions == gene, split, np.uint32(0)))
+    return (first & ~from_second & np.uint32(GENE_MASK)) | (second & from_second)
+
+
+def mutate(genomes: np.ndarray, rate: float, random: np.random.Generator) -> np.ndarray:
+    """Flip every bit of the genome matrix independently with probability rate, in place.
+
+    Only the flipped bits are drawn: the gaps between them are geometric.
+    """
+    total = genomes.size * GENE_BITS
+    if rate <= 0 or total == 0:
+        return genomes
+    flat = genomes.reshape(-1)
+    position = -1
+    expected = total * rate
+    while True:
+        gaps = random.geometric(min(rate, 1.0), size=int(expected + 5 * np.sqrt(expected) + 16))
+        flips = position + np.cumsum(gaps)
+        np.bitwise_xor.at(
+            flat,
+            flips[flips < total] // GENE_BITS,
+            np.uint32(1) << (GENE_BITS - 1 - flips[flips < total] % GENE_BITS).astype(np.uint32),
+        )
+        if flips[-1] >= total:
+            return genomes
+        position = flips[-1]
+
+
+def breed(parents: np.ndarray, count: int, fitness: np.ndarray = None, selection="uniform", random: np.random.Generator = None) -> np.ndarray:
+    """Breed count children from a matrix of parent genomes and return their genome matrix,
+    drawing from random (a fresh generator by default). The strategies in FITNESS_STRATEGIES
+    need the fitness of every parent."""
+    if fitness is None:
+        if isinstance(selection, str) and selection in FITNESS_STRATEGIES:
+            raise ValueError(f"Selection strategy {selection} needs the fitness of the parents, see fitness in constants")
+        fitness = np.ones(len(parents))
+    random = np.random.default_rng() if random is None else random
+    first, second = select_parents(count, fitness, selection, random)
+    return mutate(crossover(parents[first], parents[second], random), con.MUTATION_RATE, random)
@@ -0,0 +1,127 @@
+import json
+import os
+import struct
+import numpy as np
+import constants as con
+from population import Population
+from barriers import BarrierMap, install
+from grid import new_grid
+from rng import RandomStreams
+
+MAGIC = b"FAIBIOCK"
+VERSION = 2
+# Magic, format version and length of the JSON metadata that follows
+HEADER = struct.Struct("<8sII")
+# Arrays start on 64 byte boundaries so they can be viewed in place
+ALIGNMENT = 64
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _settings() -> dict:
+    # Scalar settings of constants, the ones a resumed run must share
+    return {
+        key: value for key, value in vars(con).items()
+        if key.isupper() and isinstance(value, (bool, int, float, str)) and key != "SIMULATION_STEP"
+    }
+
+
+class Checkpoint:
+    """A checkpoint file mapped into memory.
+
+    metadata holds the generation, step, settings and random state, and every array
+    is a read-only view into the mapping, so opening a checkpoint reads nothing but
+    the header and the pages of the arrays actually used.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._map = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, length = HEADER.unpack(bytes(self._map[:HEADER.size]))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a checkpoint")
+        if version != VERSION:
+            raise ValueError(f"Unsupported checkpoint version {version}")
+        self.metadata = json.loads(bytes(self._map[HEADER.size:HEADER.size + length]))
+        start = _aligned(HEADER.size + length)
+        self.arrays = {}
+        for name, (offset, shape, dtype) in self.metadata["arrays"].items():
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            self.arrays[name] = self._map[start + offset:start + offset + size].view(dtype).reshape(shape)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+    @property
+    def generation(self) -> int:
+        return self.metadata["generation"]
+
+    @property
+    def step(self) -> int:
+        return self.metadata["step"]
+
+
+def save_checkpoint(path: str, generation: int):
+    """Write the world to path: the population with its packed genomes, the barriers, the
+    step counter, the random state and the settings. generation is the one to run next.
+    The file is replaced atomically, a crash while writing leaves the previous one."""
+    population = con.POPULATION
+    arrays = {"barriers": con.BARRIER_MAP.cells}
+    if population is not None:
+        arrays["genomes"] = population.genomes[population.genome]
+        for name in ("pos_x", "pos_y", "dir_x", "dir_y", "oscillator_period"):
+            arrays[name] = getattr(population, name)
+        if population.brains is not None:
+            arrays["internal"] = population.brains.internal
+
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = (offset, list(array.shape), array.dtype.str)
+        offset = _aligned(offset + array.nbytes)
+    metadata = json.dumps({
+        "generation": generation,
+        "step": con.SIMULATION_STEP,
+        "shape": list(con.WORLD_MATRIX.shape),
+        "population": population is not None,
+        "settings": _settings(),
+        "random": con.RANDOM_STREAMS.get_state(),
+        "arrays": layout,
+    }).encode()
+
+    temporary = f"{path}.tmp"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(temporary, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(metadata)))
+        file.write(metadata)
+        start = _aligned(HEADER.size + len(metadata))
+        for name, array in arrays.items():
+            file.seek(start + layout[name][0])
+            file.write(memoryview(np.ascontiguousarray(array)).cast("B"))
+    os.replace(temporary, path)
+
+
+def resume_checkpoint(path: str) -> int:
+    """Restore the world and the settings saved in path, return the generation to run next"""
+    checkpoint = Checkpoint(path)
+    metadata = checkpoint.metadata
+    for key, value in metadata["settings"].items():
+        setattr(con, key, value)
+
+    shape = tuple(metadata["shape"])
+    con.WORLD_MATRIX = new_grid(shape)
+    install(con.WORLD_MATRIX, BarrierMap(shape, *np.divmod(np.asarray(checkpoint["barriers"]), shape[1])))
+    con.POPULATION = None
+    if metadata["population"]:
+        population = Population(
+            np.array(checkpoint["genomes"]), checkpoint["pos_x"], checkpoint["pos_y"], checkpoint["dir_x"], checkpoint["dir_y"]
+        )
+        population.oscillator_period[:] = checkpoint["oscillator_period"]
+        if population.brains is not None and "internal" in checkpoint.arrays:
+            population.brains.internal[:] = checkpoint["internal"]
+        population.place(con.WORLD_MATRIX)
+        con.POPULATION = population
+    con.SIMULATION_STEP = metadata["step"]
+    con.RANDOM_STREAMS = RandomStreams.from_state(metadata["random"])
+    return metadata["generation"]
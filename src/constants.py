@@ -5,13 +5,39 @@ DIM_X, DIM_Y = 1000, 1000
 # Constants for the simulation steps and generations
 STEPS_PER_GEN = 10000
 TOTAL_GENS = 5000
+# End a generation before STEPS_PER_GEN once it stagnates: checked every STAGNATION_STEPS steps,
+# when at most STAGNATION_RATE of the organisms left the cell they were in STAGNATION_STEPS steps
+# earlier. 0 runs every generation to the end
+STAGNATION_STEPS = 0
+STAGNATION_RATE = 0.0
 # Constant for the population size
 POP_SIZE = 10000
 
 # Simulation step initialization
 SIMULATION_STEP = 0
-# World initialization
-WORLD_MATRIX = [[0 for _ in range(DIM_X)] for _ in range(DIM_Y)]
+# Occupancy grid cell values, any value >= 0 is the index of the organism in that cell
+EMPTY_CELL = -1
+BARRIER_CELL = -2
+# Occupancy grid of the world, built by world.initialize_environment
+WORLD_MATRIX = None
+# How the occupancy grid is stored: "dense" keeps one cell per world cell, "chunked" only the
+# GRID_CHUNK x GRID_CHUNK chunks holding organisms or barriers, for large sparse worlds
+GRID_BACKEND = "dense"
+GRID_CHUNK = 16
+# Organisms currently alive in the world (population.Population)
+POPULATION = None
+# Barrier cells of the world (barriers.BarrierMap) and the distances to the next one in every
+# direction (rays.RayMap), both built once per world
+BARRIER_MAP = None
+BARRIER_RAYS = None
+# Barrier layout: None, a preset in barriers.PRESETS ("walls", "maze", "islands"), or the path
+# of a .png mask (dark pixels are barriers) or .npy mask (nonzero cells are), scaled to the world
+BARRIERS = None
+BARRIER_SEED = 0  # Seed of the preset layouts
+# Seed every random stream of a world derives from, None for a fresh one every run
+SEED = None
+# Random streams of the world (rng.RandomStreams), created from SEED with the world
+RANDOM_STREAMS = None
 
 # Genome and gene lengths
 LENGTH_GENOME = 24  # Total number of genes in a genome
@@ -27,6 +53,13 @@ WEIGHT_SCALING_FACTOR = math.ceil((2 ** (LENGTH_GENE * 4 - 2 * ID_BITS_COUNT - 3
 
 # Mutation rate
 MUTATION_RATE = 0.001  # Probability for a bit to flip in genomes (0, 1)
+# How parents are picked for breeding: "uniform", "fitness" or "tournament", the last two
+# weighing the survivors by fitness (below)
+SELECTION_STRATEGY = "uniform"
+TOURNAMENT_SIZE = 3  # Candidates per parent in tournament selection
+
+# Slots in the per-generation cache of pairwise genetic similarities
+SIMILARITY_CACHE_SIZE = 1 << 16
 
 # Sensory radius for creatures
 SENSOR_RADIUS_POP = 2
@@ -36,6 +69,21 @@ LONG_RANGE_DIST = 24
 SHORT_PROBE_DIST = 4
 OSC_START_PERIOD = 32
 
+# How brains are evaluated: "compiled" runs the whole population as batched weight
+# tensors, "graph" steps through the per-organism neuron objects
+BRAIN_MODE = "compiled"
+# Distinct genomes whose decoded brains are kept for reuse, the least recently used dropped first
+BRAIN_CACHE_SIZE = 1 << 14
+# Worker processes of the parallel engine, which needs compiled brains and a dense grid; 1 runs every step in this process
+WORKERS = 1
+# Island model (islands.Archipelago): worlds evolving in parallel processes, every one sending
+# MIGRATION_RATE of its survivors to another island every MIGRATION_INTERVAL generations, along
+# a "ring" or a "random" MIGRATION_TOPOLOGY
+ISLANDS = 4
+MIGRATION_INTERVAL = 10
+MIGRATION_RATE = 0.05
+MIGRATION_TOPOLOGY = "ring"
+
 # Colors for different types of neurons in brain graphs
 COLORS_NEURON = {"sensory": "#42caff", "internal": "#8a8a8a", "action": "#ffb24d"}
 
@@ -45,7 +93,7 @@ NEURON_TYPES = {
         "POS_X_AXIS",
         "POS_Y_AXIS",  # Position in world
         "CLOSEST_BOUND_X",
-        "CLOSEST_BOUND_X",
+        "CLOSEST_BOUND_Y",
         "CLOSEST_BOUND",  # Distance to nearest edge
         "GENETIC_SIMILARITY_FWD",  # Genetic similarity forward
         "PREV_MOVE_DIR_X",
@@ -75,6 +123,20 @@ NEURON_TYPES = {
 # Dimensions of output image of world
 IMG_WIDTH, IMG_HEIGHT = DIM_X * 8, DIM_Y * 8
 
-def check_survival(pos_x: int, pos_y: int) -> bool:
-    """pos_x and pos_y are the creature's position in world, return true if it survives"""
-    return pos_y < 30 and pos_x < 30 # Survives if in corner
+# Video recording: every VIDEO_FRAME_STRIDE-th step of every VIDEO_GENERATION_STRIDE-th generation
+VIDEO_FRAME_STRIDE = 1
+VIDEO_GENERATION_STRIDE = 1
+VIDEO_FPS = 30
+VIDEO_QUEUE_SIZE = 8  # Frames waiting for the encoder before the simulation blocks
+# Directory for first/last step snapshots of recorded generations, None for no snapshots
+SNAPSHOT_DIR = "images"
+
+# Where organisms survive a generation: a zone in survival.PRESETS ("corner", "left", "right",
+# "center", "edges") or the path of a .png/.npy mask, scaled to the world
+SURVIVAL_ZONE = "corner"
+# function(pos_x, pos_y) -> mask of the survivors, such as a survival.Zone, used instead of
+# SURVIVAL_ZONE when set
+check_survival = None
+# function(pos_x, pos_y) -> non-negative fitness of the survivors standing there at the end of
+# the generation, needed by the "fitness" and "tournament" selection strategies
+fitness = None
@@ -0,0 +1,32 @@
+import numpy as np
+import constants as con
+
+
+class StagnationMonitor:
+    """Tells when a generation has stopped going anywhere, so it can end early.
+
+    Every `steps` steps the positions are compared with the ones `steps` steps before, and
+    once at most `rate` of the organisms are in another cell the population has stagnated.
+    Organisms pinned against each other or a wall, brains that never fire a move and organisms
+    shuffling between two cells all count alike. Only positions are read, so the outcome is
+    as deterministic as the run, at the cost of one comparison every `steps` steps.
+    """
+
+    def __init__(self, population, steps: int = None, rate: float = None):
+        self.population = population
+        self.steps = con.STAGNATION_STEPS if steps is None else steps
+        self.rate = con.STAGNATION_RATE if rate is None else rate
+        self._snapshot()
+
+    def _snapshot(self):
+        if self.population is not None:
+            self._pos_x, self._pos_y = self.population.pos_x.copy(), self.population.pos_y.copy()
+
+    def stagnated(self, step: int) -> bool:
+        """Whether the population has stagnated once step steps of the generation are done"""
+        if self.steps <= 0 or self.population is None or step % self.steps:
+            return False
+        population = self.population
+        moved = np.count_nonzero((population.pos_x != self._pos_x) | (population.pos_y != self._pos_y))
+        self._snapshot()
+        return moved <= self.rate * len(population)
@@ -0,0 +1,97 @@
+import functools
+import numpy as np
+
+
+@functools.lru_cache(maxsize=None)
+def direction_kernels(radius: int) -> tuple[np.ndarray, np.ndarray]:
+    """Weights dx / (dx² + dy²) and dy / (dx² + dy²) of every offset in a (2r+1)² window,
+    indexed [dy + r, dx + r]; the weighted sum of the occupied offsets is the population
+    pull towards +x and +y"""
+    offsets = np.arange(-radius, radius + 1, dtype=np.float64)
+    dx, dy = np.meshgrid(offsets, offsets)
+    distance = dx * dx + dy * dy
+    distance[radius, radius] = 1  # The center holds the organism itself and has zero weight
+    return dx / distance, dy / distance
+
+
+def summed_area(values: np.ndarray) -> np.ndarray:
+    """Summed-area table with a leading row and column of zeros"""
+    table = np.zeros((values.shape[0] + 1, values.shape[1] + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(values, axis=0), axis=1, out=table[1:, 1:])
+    return table
+
+
+def window_sum(table: np.ndarray, x: np.ndarray, y: np.ndarray, radius: int) -> np.ndarray:
+    """Sum of the (2r+1)² window around every (x, y) from a summed-area table, clipped to the world"""
+    height, width = table.shape[0] - 1, table.shape[1] - 1
+    x0, x1 = np.clip(x - radius, 0, width), np.clip(x + radius + 1, 0, width)
+    y0, y1 = np.clip(y - radius, 0, height), np.clip(y + radius + 1, 0, height)
+    return table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+
+
+def _fast_length(n: int) -> int:
+    # Smallest 2^a * 3^b * 5^c >= n, FFT sizes with only small factors are fast
+    best = 1 << (n - 1).bit_length()
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            length = power35
+            while length < n:
+                length *= 2
+            best = min(best, length)
+            power35 *= 3
+        power5 *= 5
+    return best
+
+
+@functools.lru_cache(maxsize=8)
+def _kernel_spectrum(kernel_key: tuple, shape: tuple[int, int]) -> np.ndarray:
+    radius, axis = kernel_key
+    kernel = direction_kernels(radius)[axis]
+    padded = np.zeros(shape, dtype=np.float64)
+    offsets = np.arange(-radius, radius + 1)
+    padded[np.ix_(offsets % shape[0], offsets % shape[1])] = kernel
+    return np.conj(np.fft.rfft2(padded))
+
+
+def directional_fields(occupied: np.ndarray, radius: int) -> tuple[np.ndarray, np.ndarray]:
+    """Weighted sums of direction_kernels over every cell of the world, by FFT correlation,
+    so the cost does not depend on the radius"""
+    height, width = occupied.shape
+    shape = (_fast_length(height + radius), _fast_length(width + radius))
+    spectrum = np.fft.rfft2(occupied.astype(np.float64), s=shape)
+    return tuple(
+        np.fft.irfft2(spectrum * _kernel_spectrum((radius, axis), shape), s=shape)[:height, :width]
+        for axis in (0, 1)
+    )
+
+
+def neighborhood_sums(grid: np.ndarray, x: np.ndarray, y: np.ndarray, radius: int, reads: int = None) -> tuple[np.ndarray, ...]:
+    """Number of occupied cells around every (x, y), not counting the center, and the population
+    pull sums towards +x and +y. Reads the window offset by offset when that touches only a few
+    times the world's cell count, otherwise reads precomputed world-wide fields, so the cost is
+    bounded by the world area whatever the radius. reads is the number of windows to base that
+    choice on when x and y are only part of them, so every part is summed the same way."""
+    height, width = grid.shape
+    dense = isinstance(grid, np.ndarray)  # World-wide fields of a chunked grid would cost its whole area
+    if dense and (len(x) if reads is None else reads) * (2 * radius + 1) ** 2 > 4 * grid.size:
+        occupied = grid >= 0
+        count = window_sum(summed_area(occupied), x, y, radius) - occupied[y, x]
+        field_x, field_y = directional_fields(occupied, radius)
+        return count, field_x[y, x], field_y[y, x]
+
+    kernel_x, kernel_y = direction_kernels(radius)
+    count, sum_x, sum_y = np.zeros(len(x), dtype=np.int64), np.zeros(len(x)), np.zeros(len(x))
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            if dx == 0 and dy == 0:
+                continue
+            target_x, target_y = x + dx, y + dy
+            inside = (target_x >= 0) & (target_x < width) & (target_y >= 0) & (target_y < height)
+            hit = np.zeros(len(x), dtype=bool)
+            hit[inside] = grid[target_y[inside], target_x[inside]] >= 0
+            count += hit
+            sum_x += hit * kernel_x[dy + radius, dx + radius]
+            sum_y += hit * kernel_y[dy + radius, dx + radius]
+    return count, sum_x, sum_y
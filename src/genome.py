@@ -0,0 +1,100 @@
+import numpy as np
+import constants as con
+
+# Every gene is packed into one uint32 word, a genome is one row of LENGTH_GENOME words
+GENE_BITS = con.LENGTH_GENE * 4
+GENOME_BITS = GENE_BITS * con.LENGTH_GENOME
+WEIGHT_BITS = GENE_BITS - 2 * con.ID_BITS_COUNT - 2
+ID_MASK = (1 << con.ID_BITS_COUNT) - 1
+GENE_MASK = (1 << GENE_BITS) - 1
+
+
+def random_genomes(count: int, random: np.random.Generator = None) -> np.ndarray:
+    """Create a (count, LENGTH_GENOME) matrix of random packed genomes, drawn from random (a
+    fresh generator by default)"""
+    random = np.random.default_rng() if random is None else random
+    return random.integers(0, 1 << GENE_BITS, size=(count, con.LENGTH_GENOME), dtype=np.uint32)
+
+
+def from_hex(dna: list[str]) -> np.ndarray:
+    """Pack space-separated hex genomes into a genome matrix"""
+    return np.array(
+        [[int(gene, 16) for gene in genome.split(" ")] for genome in dna], dtype=np.uint32
+    ).reshape(len(dna), con.LENGTH_GENOME)
+
+
+def to_hex(genomes: np.ndarray) -> list[str]:
+    """Format every row of a genome matrix as a space-separated hex genome"""
+    return [" ".join(f"{gene:0{con.LENGTH_GENE}x}" for gene in row) for row in np.atleast_2d(genomes).tolist()]
+
+
+def color(genome: np.ndarray) -> str:
+    """Color of a genome, the first and last three hex characters of its dna"""
+    return "#%03x%03x" % (int(genome[0]) >> (GENE_BITS - 12), int(genome[-1]) & 0xFFF)
+
+
+def decode(genomes: np.ndarray) -> tuple[np.ndarray, ...]:
+    """Decode every gene of every genome into (source_type, source_id, sink_type, sink_id, weight)
+    arrays shaped like genomes; a type of 1 means internal source / action sink"""
+    genes = genomes.astype(np.int64)
+    source_type = (genes >> (GENE_BITS - 1)) & 1
+    source_id = (genes >> (GENE_BITS - 1 - con.ID_BITS_COUNT)) & ID_MASK
+    sink_type = (genes >> (WEIGHT_BITS + con.ID_BITS_COUNT)) & 1
+    sink_id = (genes >> WEIGHT_BITS) & ID_MASK
+    weight = genes & ((1 << WEIGHT_BITS) - 1)
+    weight = np.where(weight >= 1 << (WEIGHT_BITS - 1), weight - (1 << WEIGHT_BITS), weight)
+
+    sensory, internal, action = (len(con.NEURON_TYPES[t]) for t in ("sensory", "internal", "action"))
+    source_id = np.where(source_type == 1, source_id % internal, source_id % sensory)
+    sink_id = np.where(sink_type == 1, sink_id % action, sink_id % internal)
+    return source_type, source_id, sink_type, sink_id, weight / con.WEIGHT_SCALING_FACTOR
+
+
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Number of set bits in every word"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    as_bytes = np.ascontiguousarray(words, dtype=np.uint32).view(np.uint8).reshape(*np.shape(words), 4)
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=-1)
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Genetic similarity of two genome matrices row by row, from the share of differing bits
+    scaled to (0, 1): identical genomes give 1 and genomes differing in half their bits give 0"""
+    differing = popcount(first ^ second).sum(axis=-1, dtype=np.int64)
+    return 1 - np.minimum(1, (2 * differing) / (GENE_BITS * np.shape(first)[-1]))
+
+
+class SimilarityCache:
+    """Bounded table of genetic similarities keyed by genome-id pairs.
+
+    Genomes never change within a generation, so a pair is only computed again once its
+    slot got overwritten by another pair.
+    """
+
+    def __init__(self, genomes: np.ndarray, size: int):
+        self.genomes = genomes
+        self.keys = np.full(size, -1, dtype=np.int64)
+        self.values = np.zeros(size, dtype=np.float32)
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+        """Similarity between the genome ids in first and second, pairwise"""
+        low, high = np.minimum(first, second), np.maximum(first, second)
+        key = low.astype(np.int64) * len(self.genomes) + high
+        slot = ((key.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32)) % np.uint64(len(self.keys))
+        slot = slot.astype(np.int64)
+
+        values = self.values[slot]
+        miss = self.keys[slot] != key
+        if miss.any():
+            values[miss] = similarity(self.genomes[low[miss]], self.genomes[high[miss]])
+            self.keys[slot[miss]] = key[miss]
+            self.values[slot[miss]] = values[miss]
+        self.misses += int(miss.sum())
+        self.hits += len(key) - int(miss.sum())
+        return values
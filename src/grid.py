@@ -0,0 +1,158 @@
+import numpy as np
+import constants as con
+
+# Scalar coordinates, read and written without building arrays
+_INTEGER = (int, np.integer)
+
+
+class ChunkedGrid:
+    """Occupancy grid that only stores the square chunks holding something other than fill_value.
+
+    A directory with one slot number per chunk (-1 when the chunk is not stored) points into
+    one array of chunk x chunk blocks, so reading or writing any batch of cells is a couple of
+    vectorized lookups wherever the cells fall, chunk borders included. Indexing takes integer
+    (y, x) coordinates, scalars or arrays, like the dense grid; memory grows with the number of
+    chunks in use instead of with the area.
+    """
+
+    def __init__(self, shape: tuple[int, int], fill_value: int = con.EMPTY_CELL, chunk: int = 16, dtype=np.int32):
+        if chunk < 1 or chunk & (chunk - 1):
+            raise ValueError(f"Chunk size must be a power of two, not {chunk}")
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.chunk = chunk
+        self.fill_value = self.dtype.type(fill_value)
+        self._shift, self._mask = chunk.bit_length() - 1, chunk - 1
+        height, width = self.shape
+        self._directory = np.full((-(-height // chunk), -(-width // chunk)), -1, dtype=np.int32)
+        self._clear()
+
+    def _clear(self):
+        self._directory.fill(-1)
+        self._chunks = np.empty((0, self.chunk, self.chunk), dtype=self.dtype)
+        self._keys = np.empty(0, dtype=np.int64)  # Flat directory index of every slot, -1 when free
+        self._free = []
+
+    @property
+    def ndim(self) -> int:
+        return 2
+
+    @property
+    def size(self) -> int:
+        return self.shape[0] * self.shape[1]
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self._keys) - len(self._free)
+
+    @property
+    def nbytes(self) -> int:
+        return self._directory.nbytes + self._chunks.nbytes + self._keys.nbytes
+
+    def _allocate(self, keys: np.ndarray) -> np.ndarray:
+        # Slots for the given flat directory indices, storing a chunk of fill_value for every new one
+        directory = self._directory.reshape(-1)
+        missing = np.unique(keys[directory[keys] < 0])
+        if len(missing):
+            if len(self._free) < len(missing):
+                self._grow(len(missing) - len(self._free))
+            slots = np.array(self._free[-len(missing):], dtype=np.int32)
+            del self._free[-len(missing):]
+            self._chunks[slots] = self.fill_value
+            self._keys[slots] = missing
+            directory[missing] = slots
+        return directory[keys]
+
+    def _grow(self, needed: int):
+        # Room for at least needed more chunks, doubling the storage
+        used = len(self._keys)
+        capacity = max(used + needed, 2 * used, 16)
+        chunks = np.empty((capacity, self.chunk, self.chunk), dtype=self.dtype)
+        chunks[:used] = self._chunks
+        self._chunks = chunks
+        self._keys = np.concatenate([self._keys, np.full(capacity - used, -1, dtype=np.int64)])
+        self._free[:0] = range(capacity - 1, used - 1, -1)
+
+    def __getitem__(self, key):
+        y, x = key
+        if isinstance(y, _INTEGER) and isinstance(x, _INTEGER):
+            slot = self._directory[y >> self._shift, x >> self._shift]
+            return self.fill_value if slot < 0 else self._chunks[slot, y & self._mask, x & self._mask]
+        y, x = np.broadcast_arrays(np.asarray(y, dtype=np.int64), np.asarray(x, dtype=np.int64))
+        slot = self._directory[y >> self._shift, x >> self._shift]
+        values = np.full(y.shape, self.fill_value, dtype=self.dtype)
+        stored = slot >= 0
+        values[stored] = self._chunks[slot[stored], y[stored] & self._mask, x[stored] & self._mask]
+        return values
+
+    def __setitem__(self, key, value):
+        y, x = key
+        if isinstance(y, _INTEGER) and isinstance(x, _INTEGER) and isinstance(value, _INTEGER):
+            chunk_y, chunk_x = y >> self._shift, x >> self._shift
+            slot = self._directory[chunk_y, chunk_x]
+            if slot < 0:
+                if value == self.fill_value:
+                    return
+                slot = self._allocate(np.array([chunk_y * self._directory.shape[1] + chunk_x], dtype=np.int64))[0]
+            self._chunks[slot, y & self._mask, x & self._mask] = value
+            return
+        y, x = np.broadcast_arrays(np.asarray(y, dtype=np.int64), np.asarray(x, dtype=np.int64))
+        value = np.broadcast_to(np.asarray(value, dtype=self.dtype), y.shape)
+        keys = (y >> self._shift) * self._directory.shape[1] + (x >> self._shift)
+        self._allocate(keys[value != self.fill_value])
+        # Writing fill_value into a chunk that is not stored changes nothing
+        slot = self._directory.reshape(-1)[keys]
+        stored = slot >= 0
+        self._chunks[slot[stored], y[stored] & self._mask, x[stored] & self._mask] = value[stored]
+
+    def fill(self, value: int):
+        """Set every cell to value, releasing every chunk"""
+        self.fill_value = self.dtype.type(value)
+        self._clear()
+
+    def compact(self):
+        """Release the chunks holding nothing but fill_value"""
+        used = np.flatnonzero(self._keys >= 0)
+        empty = used[(self._chunks[used] == self.fill_value).all(axis=(1, 2))]
+        self._directory.reshape(-1)[self._keys[empty]] = -1
+        self._keys[empty] = -1
+        self._free.extend(empty.tolist())
+
+    def cells(self, value: int) -> tuple[np.ndarray, np.ndarray]:
+        """(y, x) of every cell holding value, in row-major order like np.nonzero"""
+        if value == self.fill_value:
+            raise ValueError("The cells holding fill_value are not stored")
+        used = np.flatnonzero(self._keys >= 0)
+        slot, inner_y, inner_x = np.nonzero(self._chunks[used] == value)
+        chunk_y, chunk_x = np.divmod(self._keys[used[slot]], self._directory.shape[1])
+        y, x = (chunk_y << self._shift) + inner_y, (chunk_x << self._shift) + inner_x
+        order = np.argsort(y * self.shape[1] + x)
+        return y[order], x[order]
+
+    def copy(self) -> "ChunkedGrid":
+        grid = ChunkedGrid(self.shape, self.fill_value, self.chunk, self.dtype)
+        grid._directory[:] = self._directory
+        grid._chunks, grid._keys, grid._free = self._chunks.copy(), self._keys.copy(), list(self._free)
+        return grid
+
+
+def new_grid(shape: tuple[int, int]):
+    """An empty occupancy grid of the GRID_BACKEND in constants"""
+    if con.GRID_BACKEND == "chunked":
+        return ChunkedGrid(shape, con.EMPTY_CELL, con.GRID_CHUNK)
+    if con.GRID_BACKEND != "dense":
+        raise ValueError(f"Unknown grid backend {con.GRID_BACKEND}")
+    return np.full(shape, con.EMPTY_CELL, dtype=np.int32)
+
+
+def find_cells(grid, value: int) -> tuple[np.ndarray, np.ndarray]:
+    """(y, x) of every cell of a grid of either backend holding value"""
+    if isinstance(grid, ChunkedGrid):
+        return grid.cells(value)
+    return np.nonzero(grid == value)
+
+
+def test_bits(bits: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Whether the bit of every (x, y) is set in a mask packed along x, as np.packbits(mask, axis=1)"""
+    x, y = np.asarray(x), np.asarray(y)
+    return (bits[y, x >> 3] & (0x80 >> (x & 7))) != 0
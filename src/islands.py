@@ -0,0 +1,195 @@
+import multiprocessing
+import traceback
+from multiprocessing import resource_tracker
+import numpy as np
+import constants as con
+from parallel import SharedArrays
+from simulation import Simulation, default_config
+
+# How islands send migrants to each other: "ring" sends island i's to island i + 1, "random"
+# picks a new permutation without fixed points at every migration
+TOPOLOGIES = ("ring", "random")
+
+
+def _emigrants(population, rate: float, capacity: int, random: np.random.Generator) -> np.ndarray:
+    # Genomes of a random rate share of the organisms, at most capacity of them
+    count = min(int(round(rate * len(population))), capacity)
+    chosen = random.choice(len(population), size=count, replace=False)
+    return population.genomes[population.genome[chosen]]
+
+
+def _settle(population, immigrants: np.ndarray, random: np.random.Generator):
+    # Replace the genomes of randomly chosen organisms by the immigrants', before they breed
+    count = min(len(immigrants), len(population))
+    replaced = random.choice(len(population), size=count, replace=False)
+    population.genome[replaced] = len(population.genomes) + np.arange(count, dtype=population.genome.dtype)
+    population.genomes = np.concatenate([population.genomes, immigrants[:count]])
+
+
+def _island(connection, index: int, seed: np.random.SeedSequence, survival, config: dict, spec: tuple):
+    # Island process loop, answers every command with (None, result) or (formatted exception, None)
+    mailboxes = SharedArrays(spec[1], spec[0])
+    simulation = Simulation(seed, survival, **config)
+    while True:
+        command, *args = connection.recv()
+        if command == "stop":
+            break
+        try:
+            result = None
+            with simulation:
+                if command == "run":
+                    result = simulation.run(*args)
+                elif command == "emigrate":
+                    # The migrants wait in this island's mailbox until everyone has written theirs
+                    rate, = args
+                    population = con.POPULATION
+                    genomes = np.empty((0, con.LENGTH_GENOME), dtype=np.uint32)
+                    if population is not None:
+                        genomes = _emigrants(population, rate, mailboxes["genomes"].shape[1], con.RANDOM_STREAMS.breeding)
+                    mailboxes["genomes"][index, :len(genomes)] = genomes
+                    mailboxes["count"][index] = len(genomes)
+                    result = len(genomes)
+                elif command == "immigrate":
+                    source, = args
+                    if con.POPULATION is not None:
+                        immigrants = mailboxes["genomes"][source, :mailboxes["count"][source]].copy()
+                        _settle(con.POPULATION, immigrants, con.RANDOM_STREAMS.breeding)
+                elif command == "genomes":
+                    population = con.POPULATION
+                    result = None if population is None else population.genomes[population.genome]
+                elif command == "save":
+                    simulation.save(*args)
+            connection.send((None, result))
+        except Exception:
+            connection.send((traceback.format_exc(), None))
+    simulation.close()
+    mailboxes.close()
+    connection.close()
+
+
+class Archipelago:
+    """Independent worlds evolving in parallel processes, trading genomes now and then.
+
+    Every island is a Simulation of its own, running whole generations (survival filter
+    and breeding included) without waiting for the others, so all cores are busy without
+    splitting a world. Every interval generations each island sends a rate share of its
+    survivors to another island, along a ring or a random permutation, where they replace
+    as many randomly chosen survivors before the next breeding. Migrants travel as packed
+    genome rows through one shared memory block of mailboxes: every island writes its
+    emigrants to its own mailbox, then reads its immigrants from its source's.
+
+    The seeds of the islands and of the random topology are all spawned from seed, so a
+    run is reproducible from it. Islands run with WORKERS = 1.
+    """
+
+    def __init__(self, islands: int = None, interval: int = None, rate: float = None, topology: str = None,
+                 seed=None, survival=None, **config):
+        self.islands = islands or con.ISLANDS
+        self.interval = interval or con.MIGRATION_INTERVAL
+        self.rate = con.MIGRATION_RATE if rate is None else rate
+        self.topology = topology or con.MIGRATION_TOPOLOGY
+        if self.topology not in TOPOLOGIES:
+            raise ValueError(f"Unknown migration topology {self.topology}")
+        self.generation = 0
+        sequence = np.random.SeedSequence(seed)
+        seeds = sequence.spawn(self.islands)
+        self.random = np.random.default_rng(sequence.spawn(1)[0])
+
+        # The settings are passed whole, so islands started without fork get them too
+        config = {**default_config(), **config, "WORKERS": 1}
+        capacity = max(1, int(round(self.rate * config["POP_SIZE"])))
+        self.mailboxes = SharedArrays({
+            "genomes": ((self.islands, capacity, config["LENGTH_GENOME"]), "<u4"),
+            "count": ((self.islands,), "<i8"),
+        })
+        context = multiprocessing.get_context()
+        # Islands must share this process's tracker, which unregisters the block once it is unlinked
+        resource_tracker.ensure_running()
+        self._connections, self._processes = [], []
+        for index in range(self.islands):
+            connection, child = context.Pipe()
+            process = context.Process(
+                target=_island, args=(child, index, seeds[index], survival, config, self.mailboxes.spec()),
+                name=f"island-{index}", daemon=True,
+            )
+            process.start()
+            child.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _call(self, messages: list) -> list:
+        # Send one message to every island and wait for all of their results
+        for connection, message in zip(self._connections, messages):
+            connection.send(message)
+        replies = [connection.recv() for connection in self._connections]
+        errors = [error for error, _ in replies if error is not None]
+        if errors:
+            raise RuntimeError("Island failed:\n" + errors[0])
+        return [result for _, result in replies]
+
+    def sources(self) -> list[int]:
+        """The island every island takes its immigrants from at the next migration"""
+        if self.topology == "ring":
+            return [(index - 1) % self.islands for index in range(self.islands)]
+        while True:
+            destinations = self.random.permutation(self.islands)
+            if not np.any(destinations == np.arange(self.islands)):
+                return np.argsort(destinations).tolist()
+
+    def migrate(self) -> list[int]:
+        """Send migrants between the islands, return how many left each island"""
+        if self.islands < 2:
+            return [0] * self.islands
+        sent = self._call([("emigrate", self.rate)] * self.islands)
+        self._call([("immigrate", source) for source in self.sources()])
+        return sent
+
+    def run(self, generations: int, report=None) -> list[list[int]]:
+        """Run every island for generations generations, migrating every interval of them;
+        return the survivor counts of every island, generation by generation. report, when
+        given, is called with (generations done, survivor counts of that generation) for every
+        generation; the islands run up to the next migration between reports, so they come
+        in bursts of one interval."""
+        history = [[] for _ in range(self.islands)]
+        while generations > 0:
+            batch = min(generations, self.interval - self.generation % self.interval)
+            survivors = self._call([("run", batch)] * self.islands)
+            for counts, island in zip(history, survivors):
+                counts.extend(island)
+            if report is not None:
+                for offset in range(batch):
+                    report(self.generation + offset + 1, [island[offset] for island in survivors])
+            self.generation += batch
+            generations -= batch
+            if self.generation % self.interval == 0:
+                self.migrate()
+        return history
+
+    def genomes(self) -> list[np.ndarray]:
+        """Genome matrix of the organisms alive on every island"""
+        return self._call([("genomes",)] * self.islands)
+
+    def save(self, path: str):
+        """Write a checkpoint of every island, island i to f"{path}.{i}" """
+        self._call([("save", f"{path}.{index}") for index in range(self.islands)])
+
+    def close(self):
+        """Stop the islands and free the mailboxes"""
+        for connection in self._connections:
+            try:
+                connection.send(("stop",))
+            except OSError:
+                pass  # The island is already gone
+        for process in self._processes:
+            process.join()
+        self._connections, self._processes = [], []
+        if self.mailboxes is not None:
+            self.mailboxes.close()
+            self.mailboxes.block.unlink()
+            self.mailboxes = None
@@ -1,8 +1,107 @@
+import argparse
+import constants as con
+import profiling
+import stats
+import replay
 from world import *
+from checkpoint import resume_checkpoint
+
+# Flags that shape the world, which a resumed run takes from its checkpoint instead
+WORLD_FLAGS = ("width", "height", "grid", "barriers")
+# Flags of a single world's run, which islands runs have no use for
+SINGLE_WORLD_FLAGS = ("stats", "profile", "trace", "replay", "resume", "video")
+
+
+def parse_arguments(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the bio simulator")
+    parser.add_argument("--headless", action="store_true", help="run without rendering, printing a summary of every generation")
+    parser.add_argument("--generations", type=int, help=f"generations to run (default {con.TOTAL_GENS})")
+    parser.add_argument("--steps", type=int, help=f"steps per generation (default {con.STEPS_PER_GEN})")
+    parser.add_argument("--stagnation", type=int, help="end a generation early once no organism got anywhere in this many steps")
+    parser.add_argument("--population", type=int, help=f"organisms per generation (default {con.POP_SIZE})")
+    parser.add_argument("--width", type=int, help=f"world width in cells (default {con.DIM_X})")
+    parser.add_argument("--height", type=int, help=f"world height in cells (default {con.DIM_Y})")
+    parser.add_argument("--workers", type=int, help="worker processes of the parallel engine")
+    parser.add_argument("--islands", type=int, help="evolve this many worlds in parallel processes, exchanging migrants (headless; the survivors of every generation are reported once its migration interval is done)")
+    parser.add_argument("--barriers", help="barrier layout: walls, maze, islands, or a .png/.npy mask file")
+    parser.add_argument("--survival", help="survival zone: corner, left, right, center, edges, or a .png/.npy mask file")
+    parser.add_argument("--grid", choices=("dense", "chunked"), help=f"occupancy grid storage (default {con.GRID_BACKEND})")
+    parser.add_argument("--seed", type=int, help="seed of every random stream of the world, ignored when resuming")
+    parser.add_argument("--video", default="videos/simulation.mp4", help="where to save the video")
+    parser.add_argument("--checkpoint", help="save the world to this file after every generation")
+    parser.add_argument("--resume", help="continue the run saved in this checkpoint file")
+    parser.add_argument("--profile", help="append per-generation phase and sensor timings to this JSONL file")
+    parser.add_argument("--trace", help="write every phase to this Chrome trace / Perfetto file")
+    parser.add_argument("--stats", help="log per-generation statistics to this .csv file, or to .npz chunks with this prefix")
+    parser.add_argument("--replay", help="record every step to this replay log directory, see replay.py to redraw it")
+    args = parser.parse_args(argv)
+    if args.islands:
+        given = [f"--{flag}" for flag in SINGLE_WORLD_FLAGS if getattr(args, flag) != parser.get_default(flag)]
+        if given:
+            parser.error(f"{', '.join(given)} cannot be combined with --islands, which runs headless without them")
+    if args.resume:
+        given = [f"--{flag}" for flag in WORLD_FLAGS if getattr(args, flag) is not None]
+        if given:
+            parser.error(f"{', '.join(given)} cannot be combined with --resume, the world comes from the checkpoint")
+    return args
+
+
+def apply_overrides(args: argparse.Namespace):
+    # Settings given on the command line replace the ones in constants
+    for key, value in (
+        ("TOTAL_GENS", args.generations),
+        ("STEPS_PER_GEN", args.steps),
+        ("STAGNATION_STEPS", args.stagnation),
+        ("POP_SIZE", args.population),
+        ("DIM_X", args.width),
+        ("DIM_Y", args.height),
+        ("WORKERS", args.workers),
+        ("GRID_BACKEND", args.grid),
+        ("BARRIERS", args.barriers),
+        ("SURVIVAL_ZONE", args.survival),
+        ("SEED", None if args.resume else args.seed),
+    ):
+        if value is not None:
+            setattr(con, key, value)
+    con.IMG_WIDTH, con.IMG_HEIGHT = con.DIM_X * 8, con.DIM_Y * 8
+
 
 if __name__ == "__main__":
-    initialize_environment()
-    print("Step 1: Environment setup done")
-    populate_creatures()
-    print("Step 2: Organisms populated")
-    record_simulation_video()
+    args = parse_arguments()
+    if args.islands:
+        from islands import Archipelago
+        apply_overrides(args)
+        with Archipelago(args.islands, seed=con.SEED) as archipelago:
+            archipelago.run(con.TOTAL_GENS, report=lambda gen, survivors: print(f"gen {gen - 1}: {survivors} survived per island"))
+            if args.checkpoint:
+                archipelago.save(args.checkpoint)
+        raise SystemExit
+    first_generation = 0
+    if args.resume:
+        first_generation = resume_checkpoint(args.resume)
+        print(f"Resumed at generation {first_generation}")
+    apply_overrides(args)
+    if not args.resume:
+        initialize_environment()
+        print("Step 1: Environment setup done")
+        populate_creatures()
+        print("Step 2: Organisms populated")
+
+    if args.profile or args.trace:
+        profiling.enable(profiling.Profiler(args.profile, args.trace))
+    if args.stats:
+        stats.enable(stats.StatsLog(args.stats))
+    if args.replay:
+        replay.enable(replay.ReplayLog(args.replay))
+
+    checkpoint_path = args.checkpoint or args.resume
+    try:
+        if args.headless:
+            run_headless(first_generation, checkpoint_path)
+        else:
+            video_path = args.video if not args.resume else args.video.replace(".mp4", f"_from_{first_generation}.mp4")
+            record_simulation_video(video_path, checkpoint_path=checkpoint_path, first_generation=first_generation)
+    finally:
+        profiling.disable()
+        stats.disable()
+        replay.disable()
@@ -1,101 +1,78 @@
-import random
 import math
-from bitstring import BitArray
-import utils
+import numpy as np
+from genome import color, to_hex
 import constants
 
 class Organism:
-    def __init__(self, dna, pos_x, pos_y):
-        self.dna = dna
-        self.pos_x = pos_x
-        self.pos_y = pos_y
-        self.dir_x = 0
-        self.dir_y = 0
-        self.oscillator_period = constants.OSC_START_PERIOD
-
-        # Set random direction on initialization
-        while self.dir_x == 0 and self.dir_y == 0:
-            self.dir_x = random.randint(-1, 1)
-            self.dir_y = random.randint(-1, 1)
-
-        # Color is the first and last three hex characters of dna
-        self.color = "#" + dna[:3] + dna[-3:]
-
-        # Decoding dna (mRNA)
-        action_neurons = set()  # A set of action neurons in the brain, no duplicates
-        connections = []  # List of dicts, indicating source, target and weight
-        for gene in dna.split(" "):
-            bits = bin(int(gene, 16))[2:].zfill(constants.LENGTH_GENE * 4)
-
-            # Decode source neuron
-            if bits[0] == "1":
-                source_type = "internal"
-            else:
-                source_type = "sensory"
-            source_id = BitArray(bin=bits[1 : constants.ID_BITS_COUNT + 1]).uint % len(
-                constants.NEURON_TYPES[source_type]
-            )
+    """Handle to organism ``index`` of a population; its state lives in the population arrays"""
+
+    def __init__(self, population, index: int):
+        self.population = population
+        self.index = index
+        self.neurons = {"sensory": {}, "internal": {}, "action": {}}  # The "brain"
+        if constants.BRAIN_MODE == "graph":
+            # Compiled brains live in population.brains instead of neuron objects
+            self.wire_brain(self.genome)
 
-            # Decode sink neuron
-            if bits[constants.ID_BITS_COUNT + 1] == "1":
-                sink_type = "action"
-            else:
-                sink_type = "internal"
-            sink_id = BitArray(
-                bin=bits[constants.ID_BITS_COUNT + 2 : 2 * constants.ID_BITS_COUNT + 2]
-            ).uint % len(constants.NEURON_TYPES[sink_type])
-
-            # Decode weights
-            weight = BitArray(bin=bits[2 * constants.ID_BITS_COUNT + 2 :]).int / constants.WEIGHT_SCALING_FACTOR
-            if sink_type == "action":
-                action_neurons.add(constants.NEURON_TYPES[sink_type][sink_id])
-            # Add to the connections list
-            connections.append(
-                {
-                    "from_type": source_type,
-                    "from": constants.NEURON_TYPES[source_type][source_id],
-                    "to_type": sink_type,
-                    "to": constants.NEURON_TYPES[sink_type][sink_id],
-                    "weight": weight,
-                }
+    def wire_brain(self, genome: np.ndarray):
+        # The wiring of a genome is decoded once and shared, each organism builds its own
+        # neurons from it to hold their activations
+        from brain import wiring
+        from action_neuron import ActionNode
+        from internal_neuron import InternalNode
+        from sensory_neuron import SensingNode
+        nodes = {"sensory": SensingNode, "internal": InternalNode, "action": ActionNode}
+        neurons, connections = wiring(genome)
+        for neuron_type, name in neurons:
+            self.neurons[neuron_type][name] = nodes[neuron_type](self, name)
+        for source_type, source, sink_type, sink, weight in connections:
+            self.neurons[source_type][source].connections.append(
+                {"neural_node": self.neurons[sink_type][sink], "weight": weight}
             )
 
-        # Creating the neuron  (rRNA)
-        self.neurons = {"sensory": {}, "internal": {}, "action": {}}  # The "brain"
-        for action in action_neurons:
-            from action_neuron import ActionNode
-            self.neurons["action"][action] = ActionNode(self, action)
-            children = [self.neurons["action"][action]]
-
-            while len(children) > 0:
-                new_children = []
-                for child in children:
-                    cc = {"neural_node": child, "weight": 0}
-                    for c in connections:
-                        if c["to"] == child.identifier:
-                            cc["weight"] = c["weight"]
-                            if c["from"] in self.neurons[c["from_type"]]:
-                                # If the neuron is already created, just add the connection
-                                self.neurons[c["from_type"]][
-                                    c["from"]
-                                ].connections.append(cc)
-                            else:
-                                # Create the neuron
-                                if c["from_type"] == "internal":
-                                    from internal_neuron import InternalNode
-                                    new_neuron = InternalNode(self, c["from"])
-                                    # Internal neurons can be a child of other neurons,
-                                    # sensory neurons can't
-                                    new_children.append(new_neuron)
-                                else:
-                                    from sensory_neuron import SensingNode
-                                    new_neuron = SensingNode(self, c["from"])
-                                self.neurons[c["from_type"]][c["from"]] = new_neuron
-                                self.neurons[c["from_type"]][
-                                    c["from"]
-                                ].connections.append(cc)
-                            connections.remove(c)
-                children = new_children
+    @property
+    def genome(self) -> np.ndarray:
+        return self.population.genomes[self.population.genome[self.index]]
+
+    @property
+    def color(self) -> str:
+        return color(self.genome)
+
+    @property
+    def dna(self) -> str:
+        # Hex form of the genome, only built on demand
+        return to_hex(self.genome)[0]
+
+    @property
+    def pos_x(self) -> int:
+        return int(self.population.pos_x[self.index])
+
+    @property
+    def pos_y(self) -> int:
+        return int(self.population.pos_y[self.index])
+
+    @property
+    def dir_x(self) -> int:
+        return int(self.population.dir_x[self.index])
+
+    @property
+    def dir_y(self) -> int:
+        return int(self.population.dir_y[self.index])
+
+    @property
+    def oscillator_period(self) -> float:
+        return float(self.population.oscillator_period[self.index])
+
+    @oscillator_period.setter
+    def oscillator_period(self, value: float):
+        self.population.oscillator_period[self.index] = value
+
+    def uniform(self, row: int) -> float:
+        # This organism's number in row of the step's draws (see world.draw_step_uniforms), or a
+        # fresh number from the step stream when the brain runs outside simulate_world
+        if self.population.uniforms is None:
+            return float(constants.RANDOM_STREAMS.uniforms(1, 1)[0, 0])
+        return float(self.population.uniforms[row, self.index])
 
     def process_brain(self):
         # Calculate the output of action neurons
@@ -104,7 +81,9 @@ class Organism:
                 self.neurons[t][n].compute_output()
                 self.neurons[t][n].distribute_inputs()
 
-    def perform_actions(self):
+    def perform_actions(self) -> tuple[int, int]:
+        # Work out the move the action neurons ask for, (delta_x, delta_y) with each -1, 0 or 1;
+        # moves are resolved for the whole population at once
         delta_x, delta_y = 0, 0
 
         for n in self.neurons["action"]:
@@ -123,8 +102,8 @@ class Organism:
                 case "MOVE_RAND":
                     if output > 0:
                         # Only move randomly if the action neuron is activated
-                        delta_x += random.random() * 2 - 1
-                        delta_y += random.random() * 2 - 1
+                        delta_x += self.uniform(1) * 2 - 1
+                        delta_y += self.uniform(2) * 2 - 1
                 case "SET_OSC_PERIOD":
                     self.oscillator_period = 2.5 + math.exp(3 * (math.tanh(output) + 1))
                 case _:
@@ -133,18 +112,6 @@ class Organism:
                     )
 
         delta_x, delta_y = math.tanh(delta_x), math.tanh(delta_y)  # Turn into a probability (from 0 to 1)
-        prob_x, prob_y = random.random() < abs(delta_x), random.random() < abs(delta_y)
+        prob_x, prob_y = self.uniform(3) < abs(delta_x), self.uniform(4) < abs(delta_y)
         sign_x, sign_y = -1 if delta_x < 0 else 1, -1 if delta_y < 0 else 1
-        self.move(prob_x * sign_x, prob_y * sign_y)
-
-    def move(self, delta_x, delta_y):
-        # Move the creature in the world
-        target_x, target_y = self.pos_x + delta_x, self.pos_y + delta_y
-        if utils.is_within_world_limits(target_x, target_y) and constants.WORLD_MATRIX[target_y][target_x] == 0:
-            constants.WORLD_MATRIX[self.pos_y][self.pos_x] = 0
-            constants.WORLD_MATRIX[target_y][target_x] = self
-            self.pos_x += delta_x
-            self.pos_y += delta_y
-        if (delta_x, delta_y) == (0, 0):
-            self.dir_x = delta_x
-            self.dir_y = delta_y
+        return prob_x * sign_x, prob_y * sign_y
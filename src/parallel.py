@@ -0,0 +1,304 @@
+import atexit
+import multiprocessing
+import traceback
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import constants as con
+import profiling
+from brain import CompiledBrains
+from genome import SimilarityCache
+from population import DIRECTIONS
+from rays import RayMap, ray_limit
+from sensing import compute_sensors
+from world import apply_moves, decide_moves, draw_step_uniforms
+
+# Per-organism arrays copied to the workers every step
+STEP_ARRAYS = ("pos_x", "pos_y", "dir_x", "dir_y", "oscillator_period")
+# Brain arrays copied to the workers once per population: one row per distinct genome, then
+# one per organism
+BRAIN_ARRAYS = (
+    "sensory_internal", "internal_internal", "internal_action", "sensory_action", "has_action", "uses_sensor",
+    "brain", "internal",
+)
+
+
+class SharedArrays:
+    """Named arrays laid out in one shared memory block.
+
+    The engine creates the block from a layout {name: (shape, dtype)}, the workers attach
+    to it by name through spec().
+    """
+
+    def __init__(self, layout: dict, name: str = None):
+        self.layout = layout
+        offsets, size = {}, 0
+        for key, (shape, dtype) in layout.items():
+            offsets[key] = size
+            size += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 64) * 64  # Keep every array cache line aligned
+        self.block = shared_memory.SharedMemory(name=name, create=name is None, size=max(size, 1))
+        self.arrays = {
+            key: np.ndarray(shape, dtype, buffer=self.block.buf, offset=offsets[key])
+            for key, (shape, dtype) in layout.items()
+        }
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        return self.arrays[key]
+
+    def spec(self) -> tuple:
+        return self.block.name, self.layout
+
+    def close(self):
+        # Every array must be dropped before the block can be unmapped
+        self.arrays = {}
+        self.block.close()
+
+
+class _StripView:
+    """What a worker sees of the world: the population, its brains, the grid and the barrier
+    ray map read straight from shared memory, for the organisms standing in rows first..last-1."""
+
+    def __init__(self, world: SharedArrays, shared: SharedArrays, count: int, genome_count: int, rows: tuple[int, int]):
+        self.rows = rows
+        self.grid = world["grid"]
+        con.BARRIER_RAYS = RayMap(self.grid.shape, ray_limit(), world["barrier_rays"])
+
+        self.genomes = shared["genomes"][:genome_count]
+        self.genome = shared["genome"][:count]
+        for key in STEP_ARRAYS + ("move_x", "move_y"):
+            setattr(self, key, shared[key][:count])
+        self.uniforms = shared["uniforms"][:, :count]
+        self.similarity = SimilarityCache(self.genomes, con.SIMILARITY_CACHE_SIZE)
+        self.brains = object.__new__(CompiledBrains)
+        for key in BRAIN_ARRAYS:
+            setattr(self.brains, key, shared[key][:count])
+        # The compiled brains fill only the rows the organisms point to
+        distinct = int(self.brains.brain.max()) + 1 if count else 0
+        for key in BRAIN_ARRAYS[:-2]:
+            setattr(self.brains, key, shared[key][:distinct])
+
+    def __len__(self) -> int:
+        return len(self.genome)
+
+    def think(self, step: int):
+        # Sense, run the brains and decide the moves of the organisms in the strip
+        con.SIMULATION_STEP = step
+        first, last = self.rows
+        owned = np.flatnonzero((self.pos_y >= first) & (self.pos_y < last))
+        uniforms = self.uniforms[:, owned]
+        sensors = compute_sensors(self, self.grid, self.brains.uses_sensor[self.brains.brain], owned, uniforms[0])
+        self.move_x[owned], self.move_y[owned] = decide_moves(self, self.brains.evaluate(sensors, owned), uniforms, owned)
+
+
+def _worker(connection, config: dict):
+    # Worker process loop, answers every command with None or the formatted exception
+    for key, value in config.items():
+        setattr(con, key, value)
+    world = shared = view = None
+    while True:
+        command, *args = connection.recv()
+        if command == "stop":
+            break
+        try:
+            if command == "load":
+                world_spec, shared_spec, count, genome_count, rows = args
+                view = con.BARRIER_RAYS = None
+                if world is None or world.spec() != world_spec:
+                    if world is not None:
+                        world.close()
+                    world = SharedArrays(world_spec[1], world_spec[0])
+                if shared is None or shared.spec() != shared_spec:
+                    if shared is not None:
+                        shared.close()
+                    shared = SharedArrays(shared_spec[1], shared_spec[0])
+                view = _StripView(world, shared, count, genome_count, rows)
+            elif command == "think":
+                view.think(*args)
+            connection.send(None)
+        except Exception:
+            connection.send(traceback.format_exc())
+    connection.close()
+
+
+class ParallelEngine:
+    """Runs simulate_world steps of a compiled-brain population across worker processes.
+
+    The world is cut into horizontal strips, one per worker, each holding about the same
+    number of organisms when a population is loaded. The occupancy grid and the barrier ray
+    map live in shared memory, so the halo rows a worker reads around its strip are its
+    neighbours' rows themselves; ownership follows pos_y every step, so an organism that
+    crosses a strip edge moves to the next worker without anything being exchanged.
+
+    Every step the workers sense, think and decide moves for their strips. The moves are
+    then resolved and applied here in one pass, exactly as the single-process engine does.
+    The step's random numbers are drawn here in the single-process order, so a fixed seed
+    gives the same run with any number of workers.
+    """
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or con.WORKERS
+        context = multiprocessing.get_context()
+        config = {
+            key: value for key, value in vars(con).items()
+            if key.isupper() and key not in ("WORLD_MATRIX", "POPULATION", "BARRIER_MAP", "BARRIER_RAYS", "RANDOM_STREAMS")
+        }
+        # Workers must share this process's tracker, which unregisters blocks as they are unlinked
+        resource_tracker.ensure_running()
+        self._connections, self._processes = [], []
+        for index in range(self.workers):
+            connection, child = context.Pipe()
+            process = context.Process(target=_worker, args=(child, config), name=f"world-strip-{index}", daemon=True)
+            process.start()
+            child.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+        self.world = None
+        self.shared = None
+        self.population = None
+        self._pos_x = None
+
+    def _call(self, messages: list):
+        # Send one message to every worker and wait until all of them are done
+        for connection, message in zip(self._connections, messages):
+            connection.send(message)
+        errors = [error for error in (connection.recv() for connection in self._connections) if error is not None]
+        if errors:
+            raise RuntimeError("Parallel engine worker failed:\n" + errors[0])
+
+    def _bound(self, population) -> bool:
+        # Whether the workers see this population and the current world arrays
+        return (
+            population is self.population
+            and population.pos_x is self._pos_x
+            and self.world is not None
+            and con.WORLD_MATRIX is self.world["grid"]
+            and con.BARRIER_RAYS.distance is self.world["barrier_rays"]
+        )
+
+    def strips(self, population) -> list[tuple[int, int]]:
+        """Row ranges of the workers, cut so each holds about the same number of organisms"""
+        height = con.WORLD_MATRIX.shape[0]
+        filled = np.cumsum(np.bincount(population.pos_y, minlength=height))
+        cuts = np.searchsorted(filled, np.arange(1, self.workers) * len(population) / self.workers)
+        bounds = [0, *np.minimum(cuts + 1, height).tolist(), height]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def load(self, population):
+        """Share the world and the population with the workers"""
+        shape = con.WORLD_MATRIX.shape
+        if self.world is None or self.world["grid"].shape != shape:
+            self._release_world()
+            ray_shape, ray_dtype = (len(DIRECTIONS), *shape), con.BARRIER_RAYS.distance.dtype.str
+            self.world = SharedArrays({
+                "grid": (shape, "<i4"),
+                "barrier_rays": (ray_shape, ray_dtype),
+            })
+
+        # The world-sized arrays are moved into shared memory, only copied when they changed
+        self.population = self._pos_x = None
+        for key, holder, name in (
+            ("grid", con, "WORLD_MATRIX"),
+            ("barrier_rays", con.BARRIER_RAYS, "distance"),
+        ):
+            if getattr(holder, name) is not self.world[key]:
+                self.world[key][...] = getattr(holder, name)
+                setattr(holder, name, self.world[key])
+
+        # The population-sized arrays are copied, the block only grows
+        count, genome_count = len(population), len(population.genomes)
+        brains = population.brains
+        if self.shared is None or len(self.shared["genome"]) < count or len(self.shared["genomes"]) < genome_count:
+            capacity, genome_capacity = max(count, con.POP_SIZE), max(genome_count, con.POP_SIZE)
+            layout = {
+                "genomes": ((genome_capacity, population.genomes.shape[1]), "<u4"),
+                "genome": ((capacity,), "<i4"),
+                "pos_x": ((capacity,), "<i4"), "pos_y": ((capacity,), "<i4"),
+                "dir_x": ((capacity,), "|i1"), "dir_y": ((capacity,), "|i1"),
+                "move_x": ((capacity,), "|i1"), "move_y": ((capacity,), "|i1"),
+                "oscillator_period": ((capacity,), "<f8"),
+                "uniforms": ((6, capacity), "<f8"),
+            }
+            for key in BRAIN_ARRAYS:
+                value = getattr(brains, key)
+                layout[key] = ((capacity, *value.shape[1:]), value.dtype.str)
+            self._release_shared()
+            self.shared = SharedArrays(layout)
+        self.shared["genomes"][:genome_count] = population.genomes
+        self.shared["genome"][:count] = population.genome
+        for key in BRAIN_ARRAYS:
+            value = getattr(brains, key)
+            self.shared[key][:len(value)] = value
+
+        self._call([
+            ("load", self.world.spec(), self.shared.spec(), count, genome_count, rows)
+            for rows in self.strips(population)
+        ])
+        self.population, self._pos_x = population, population.pos_x
+
+    def step(self, population):
+        """Advance population by one step, like simulate_world without the step counter"""
+        if not self._bound(population):
+            self.load(population)
+        count, shared = len(population), self.shared
+        for key in STEP_ARRAYS:
+            shared[key][:count] = getattr(population, key)
+        shared["uniforms"][:, :count] = draw_step_uniforms(count)
+        with profiling.phase("think"):
+            # Sensing happens in the workers too, so it is part of this phase
+            self._call([("think", con.SIMULATION_STEP)] * self.workers)
+        population.oscillator_period[:] = shared["oscillator_period"][:count]
+        population.brains.internal[:] = shared["internal"][:count]
+
+        with profiling.phase("act"):
+            apply_moves(population, shared["move_x"][:count], shared["move_y"][:count], shared["uniforms"][5, :count])
+
+    def _release_world(self):
+        # Hand private copies of the shared world arrays back to their owners
+        if self.world is None:
+            return
+        self.population = self._pos_x = None
+        if con.WORLD_MATRIX is self.world["grid"]:
+            con.WORLD_MATRIX = self.world["grid"].copy()
+        if con.BARRIER_RAYS is not None and con.BARRIER_RAYS.distance is self.world["barrier_rays"]:
+            con.BARRIER_RAYS.distance = con.BARRIER_RAYS.distance.copy()
+        self.world.close()
+        self.world.block.unlink()
+        self.world = None
+
+    def _release_shared(self):
+        if self.shared is not None:
+            self.shared.close()
+            self.shared.block.unlink()
+            self.shared = None
+
+    def close(self):
+        """Stop the workers and free the shared memory"""
+        for connection in self._connections:
+            try:
+                connection.send(("stop",))
+            except OSError:
+                pass  # The worker is already gone
+        for process in self._processes:
+            process.join()
+        self._connections, self._processes = [], []
+        self._release_world()
+        self._release_shared()
+
+
+_engine = None
+
+
+def parallel_engine() -> ParallelEngine:
+    """The engine with con.WORKERS workers, started on first use and stopped at exit"""
+    global _engine
+    if _engine is not None and _engine.workers != con.WORKERS:
+        _engine.close()
+        _engine = None
+    if _engine is None:
+        _engine = ParallelEngine(con.WORKERS)
+    return _engine
+
+
+@atexit.register
+def _close_engine():
+    if _engine is not None:
+        _engine.close()
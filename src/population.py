@@ -0,0 +1,62 @@
+import numpy as np
+import constants as con
+from genome import SimilarityCache
+
+# The 8 possible facing directions as (dir_x, dir_y) pairs
+DIRECTIONS = np.array(
+    [(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if (dx, dy) != (0, 0)],
+    dtype=np.int8,
+)
+
+
+class Population:
+    """Struct-of-arrays store for every organism alive in the world.
+
+    Organism ``i`` lives at ``(pos_x[i], pos_y[i])`` and ``WORLD_MATRIX`` holds ``i``
+    at that cell, so both directions of the lookup are O(1).
+    """
+
+    def __init__(self, genomes: np.ndarray, pos_x, pos_y, dir_x=None, dir_y=None):
+        count = len(genomes)
+        self.genomes = np.asarray(genomes, dtype=np.uint32)  # Packed genome table, indexed through self.genome
+        self.genome = np.arange(count, dtype=np.int32)
+        self.pos_x = np.asarray(pos_x, dtype=np.int32).copy()
+        self.pos_y = np.asarray(pos_y, dtype=np.int32).copy()
+
+        # Random facing direction for every organism unless given
+        if dir_x is None or dir_y is None:
+            directions = DIRECTIONS[con.RANDOM_STREAMS.placement.integers(len(DIRECTIONS), size=count)]
+            dir_x, dir_y = directions[:, 0], directions[:, 1]
+        self.dir_x = np.asarray(dir_x, dtype=np.int8).copy()
+        self.dir_y = np.asarray(dir_y, dtype=np.int8).copy()
+        self.oscillator_period = np.full(count, con.OSC_START_PERIOD, dtype=np.float64)
+        self.similarity = SimilarityCache(self.genomes, con.SIMILARITY_CACHE_SIZE)
+        self.uniforms = None  # Random numbers of the current step, for graph brains
+
+        from organism import Organism
+        self.organisms = [Organism(self, i) for i in range(count)]
+        self.brains = None
+        if con.BRAIN_MODE == "compiled":
+            from brain import CompiledBrains
+            self.brains = CompiledBrains(self.genomes[self.genome])
+
+    def __len__(self) -> int:
+        return len(self.organisms)
+
+    def place(self, grid: np.ndarray):
+        """Write the organism indices into the occupancy grid"""
+        grid[self.pos_y, self.pos_x] = np.arange(len(self), dtype=np.int32)
+
+    def keep(self, mask: np.ndarray, grid: np.ndarray):
+        """Drop every organism where mask is False, compacting the arrays and the grid"""
+        mask = np.asarray(mask, dtype=bool)
+        grid[self.pos_y[~mask], self.pos_x[~mask]] = con.EMPTY_CELL
+
+        for name in ("genome", "pos_x", "pos_y", "dir_x", "dir_y", "oscillator_period"):
+            setattr(self, name, getattr(self, name)[mask])
+        if self.brains is not None:
+            self.brains = self.brains[mask]
+        self.organisms = [o for o, alive in zip(self.organisms, mask) if alive]
+        for index, organism in enumerate(self.organisms):
+            organism.index = index
+        self.place(grid)
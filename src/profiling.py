@@ -0,0 +1,154 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+_active = None
+_NULL_PHASE = contextlib.nullcontext()
+
+
+class _Phase:
+    # Times one phase of the profiler, as a context manager
+    __slots__ = ("profiler", "name", "started")
+
+    def __init__(self, profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.started, time.perf_counter_ns() - self.started)
+
+
+class Profiler:
+    """Phase timers, sensor counters and step rates of a run, summarized once per generation.
+
+    Every generation appends one JSON line to jsonl_path with the time spent in each phase,
+    the calls and time of every sensor, the steps and organisms simulated per second, and the
+    hits and misses of the brain cache.
+    With trace_path, every phase is also written as a Chrome trace event, loadable in
+    chrome://tracing and Perfetto; the file is streamed so it can be opened while the run
+    is still going.
+    """
+
+    def __init__(self, jsonl_path: str = None, trace_path: str = None):
+        self.jsonl_path = jsonl_path
+        self.trace_path = trace_path
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+        self._events = []
+        self._trace = None
+        if trace_path is not None:
+            os.makedirs(os.path.dirname(trace_path) or ".", exist_ok=True)
+            self._trace = open(trace_path, "w")
+            self._trace.write("[\n")
+        self._reset()
+
+    def _reset(self):
+        self.phases = defaultdict(lambda: [0, 0])  # name -> [calls, nanoseconds]
+        self.sensors = defaultdict(lambda: [0, 0])  # name -> [calls, nanoseconds]
+        self.steps = 0
+        self.organism_steps = 0
+        self.step_time = 0
+
+    def phase(self, name: str) -> _Phase:
+        return _Phase(self, name)
+
+    def record(self, name: str, started: int, duration: int):
+        """Add a phase that started at perf_counter_ns() started and lasted duration ns"""
+        with self._lock:
+            phase = self.phases[name]
+            phase[0] += 1
+            phase[1] += duration
+            if self._trace is not None:
+                self._events.append((name, started, duration, threading.get_ident()))
+
+    def sensor(self, name: str, duration: int, calls: int = 1):
+        """Add calls of a sensor that took duration ns in total"""
+        sensor = self.sensors[name]
+        sensor[0] += calls
+        sensor[1] += duration
+
+    def step(self, organisms: int, duration: int):
+        """Count a simulation step over organisms that took duration ns"""
+        self.steps += 1
+        self.organism_steps += organisms
+        self.step_time += duration
+
+    def summary(self, generation: int) -> dict:
+        from brain import BRAIN_CACHE
+        seconds = self.step_time / 1e9
+        return {
+            "generation": generation,
+            "steps": self.steps,
+            "steps_per_second": self.steps / seconds if seconds else None,
+            "organisms_per_second": self.organism_steps / seconds if seconds else None,
+            "phases": {name: {"calls": calls, "seconds": ns / 1e9} for name, (calls, ns) in self.phases.items()},
+            "sensors": {name: {"calls": calls, "seconds": ns / 1e9} for name, (calls, ns) in self.sensors.items()},
+            # Counted since the start of the run
+            "brain_cache": {"hits": BRAIN_CACHE.hits, "misses": BRAIN_CACHE.misses, "entries": len(BRAIN_CACHE)},
+        }
+
+    def end_generation(self, generation: int) -> dict:
+        """Write out and reset the figures of the generation that just ended, and return them"""
+        with self._lock:
+            summary = self.summary(generation)
+            events, self._events = self._events, []
+            self._reset()
+        if self.jsonl_path is not None:
+            with open(self.jsonl_path, "a") as file:
+                file.write(json.dumps(summary) + "\n")
+        if self._trace is not None:
+            pid = os.getpid()
+            for name, started, duration, thread in events:
+                event = {
+                    "name": name, "ph": "X", "pid": pid, "tid": thread,
+                    "ts": (started - self._origin) / 1e3, "dur": duration / 1e3, "args": {"generation": generation},
+                }
+                self._trace.write(json.dumps(event) + ",\n")
+            self._trace.flush()
+        return summary
+
+    def close(self):
+        if self._trace is not None:
+            # A metadata event naming the process follows the comma after the last phase
+            self._trace.write(json.dumps({"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": "bio-simulator"}}) + "]\n")
+            self._trace.close()
+            self._trace = None
+
+
+def enable(profiler: Profiler) -> Profiler:
+    """Make profiler collect from the simulation loop"""
+    global _active
+    _active = profiler
+    return profiler
+
+
+def disable():
+    """Stop collecting and close the active profiler"""
+    global _active
+    if _active is not None:
+        _active.close()
+    _active = None
+
+
+def active() -> Profiler:
+    """The profiler collecting now, None when profiling is off"""
+    return _active
+
+
+def phase(name: str):
+    """Context manager timing a phase of the active profiler, a shared no-op when profiling is off"""
+    if _active is None:
+        return _NULL_PHASE
+    return _active.phase(name)
+
+
+def end_generation(generation: int):
+    if _active is not None:
+        _active.end_generation(generation)
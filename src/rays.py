@@ -0,0 +1,162 @@
+import numpy as np
+import constants as con
+from grid import ChunkedGrid
+from population import DIRECTIONS
+
+# Index into DIRECTIONS of every (dir_x, dir_y), looked up as [dir_y + 1, dir_x + 1]; -1 for no direction
+DIRECTION_INDEX = np.full((3, 3), -1, dtype=np.int8)
+DIRECTION_INDEX[DIRECTIONS[:, 1] + 1, DIRECTIONS[:, 0] + 1] = np.arange(len(DIRECTIONS))
+
+
+def ray_limit() -> int:
+    # Longest distance any probe sensor needs to tell apart from "nothing there"
+    return max(con.LONG_RANGE_DIST, con.SHORT_PROBE_DIST + 1)
+
+
+class RayMap:
+    """Distance from every cell to the next marked cell in each of the 8 directions.
+
+    distance[k, y, x] is the smallest d >= 1 such that (x, y) + d * DIRECTIONS[k] is marked,
+    or limit when there is none closer. Cells are marked in batches, only the cells whose
+    rays reach a marked cell are touched.
+    """
+
+    def __init__(self, shape: tuple[int, int], limit: int, distance: np.ndarray = None):
+        self.shape = shape
+        self.limit = limit
+        if distance is None:
+            distance = np.full((len(DIRECTIONS), *shape), limit, dtype=np.uint8 if limit < 256 else np.uint16)
+        self.distance = distance
+
+        # Offsets d * DIRECTIONS[k] for every direction and d in 1..limit-1, and the same as
+        # offsets into the flattened distance array
+        height, width = shape
+        self._steps = np.arange(1, limit, dtype=self.distance.dtype)
+        self._offset_x = (DIRECTIONS[:, 0, None] * self._steps.astype(np.int32)).astype(np.int32)
+        self._offset_y = (DIRECTIONS[:, 1, None] * self._steps.astype(np.int32)).astype(np.int32)
+        self._flat_offset = (
+            np.arange(len(DIRECTIONS), dtype=np.int64)[:, None] * height * width - (self._offset_y * width + self._offset_x)
+        )
+
+    def mark(self, x: np.ndarray, y: np.ndarray):
+        """Mark the given cells"""
+        # Every cell within limit whose ray in some direction reaches a marked cell, as an index
+        # into the flattened distance array, and the distance along that ray
+        height, width = self.shape
+        x, y = np.asarray(x, dtype=np.int32)[:, None, None], np.asarray(y, dtype=np.int32)[:, None, None]
+        inside = (x >= self._offset_x) & (x < width + self._offset_x) & (y >= self._offset_y) & (y < height + self._offset_y)
+        source = ((y.astype(np.int64) * width + x) + self._flat_offset)[inside]
+        step = np.broadcast_to(self._steps, inside.shape)[inside]
+        np.minimum.at(self.distance.reshape(-1), source, step)
+
+    def lookup(self, x: np.ndarray, y: np.ndarray, dir_x: np.ndarray, dir_y: np.ndarray) -> np.ndarray:
+        """Distance to the next marked cell along (dir_x, dir_y) from every (x, y), limit when
+        there is none or the direction is (0, 0)"""
+        direction = DIRECTION_INDEX[dir_y + 1, dir_x + 1]
+        facing = direction >= 0
+        distance = np.full(len(direction), self.limit, dtype=np.int64)
+        distance[facing] = self.distance[direction[facing], y[facing], x[facing]]
+        return distance
+
+
+class ScanRayMap:
+    """RayMap for worlds whose area is too large to hold distances for every cell.
+
+    Only the marked cells are kept, in a ChunkedGrid, and a lookup walks the ray of every
+    organism still looking, up to limit - 1 cells, so lookups see the same cells a RayMap's do.
+    """
+
+    def __init__(self, shape: tuple[int, int], limit: int, chunk: int = 16):
+        self.shape = shape
+        self.limit = limit
+        self.marks = ChunkedGrid(shape, 0, chunk, dtype=np.uint8)
+
+    def mark(self, x: np.ndarray, y: np.ndarray):
+        """Mark the given cells"""
+        self.marks[y, x] = 1
+
+    def lookup(self, x: np.ndarray, y: np.ndarray, dir_x: np.ndarray, dir_y: np.ndarray) -> np.ndarray:
+        """Distance to the next marked cell along (dir_x, dir_y) from every (x, y), limit when
+        there is none or the direction is (0, 0)"""
+        return _scan(lambda target_y, target_x: self.marks[target_y, target_x] != 0, self.shape, self.limit, x, y, dir_x, dir_y)
+
+
+class OccupancyRays:
+    """Rays to the next organism, read straight off an occupancy grid.
+
+    The grid already tells which cells hold an organism, so nothing is kept up to date as
+    organisms move: a lookup walks the ray of every organism asking, up to limit - 1 cells,
+    like ScanRayMap.lookup. A step only pays for the organisms whose brains read the probe,
+    instead of updating the rays of every cell around every move.
+    """
+
+    def __init__(self, grid: np.ndarray, limit: int = None):
+        self.grid = grid
+        self.shape = grid.shape
+        self.limit = ray_limit() if limit is None else limit
+
+    def lookup(self, x: np.ndarray, y: np.ndarray, dir_x: np.ndarray, dir_y: np.ndarray) -> np.ndarray:
+        """Distance to the next organism along (dir_x, dir_y) from every (x, y), limit when
+        there is none or the direction is (0, 0)"""
+        return _scan(lambda target_y, target_x: self.grid[target_y, target_x] >= 0, self.shape, self.limit, x, y, dir_x, dir_y)
+
+
+def _scan(occupied, shape: tuple[int, int], limit: int, x, y, dir_x, dir_y) -> np.ndarray:
+    # Walk the rays of every (x, y) still looking one step at a time, occupied(target_y, target_x)
+    # telling which of the cells reached are marked
+    height, width = shape
+    x, y = np.asarray(x, dtype=np.int64), np.asarray(y, dtype=np.int64)
+    dir_x, dir_y = np.asarray(dir_x, dtype=np.int64), np.asarray(dir_y, dtype=np.int64)
+    distance = np.full(len(x), limit, dtype=np.int64)
+    looking = np.flatnonzero((dir_x != 0) | (dir_y != 0))
+    for step in range(1, limit):
+        target_x, target_y = x[looking] + step * dir_x[looking], y[looking] + step * dir_y[looking]
+        inside = (target_x >= 0) & (target_x < width) & (target_y >= 0) & (target_y < height)
+        looking = looking[inside]
+        found = occupied(target_y[inside], target_x[inside])
+        distance[looking[found]] = step
+        looking = looking[~found]
+        if len(looking) == 0:
+            break
+    return distance
+
+
+def ray_map(grid: np.ndarray) -> RayMap:
+    """An unmarked ray map the size of an occupancy grid, scanning the marks of a chunked one"""
+    if isinstance(grid, ChunkedGrid):
+        return ScanRayMap(grid.shape, ray_limit(), grid.chunk)
+    return RayMap(grid.shape, ray_limit())
+
+
+def long_probe(rays: RayMap, x, y, dir_x, dir_y) -> np.ndarray:
+    """Closeness of the next marked cell in the forward direction, (0, 1], 0 if nothing is in range"""
+    distance = rays.lookup(x, y, dir_x, dir_y)
+    return np.where(distance < con.LONG_RANGE_DIST, (con.LONG_RANGE_DIST - distance + 1) / con.LONG_RANGE_DIST, 0)
+
+
+def _edge_distance(x, y, dir_x, dir_y) -> np.ndarray:
+    # Steps along the direction until leaving the world; no axis reaches further than
+    # DIM_X + DIM_Y, which stands for never along an axis the direction does not move on
+    x, y = np.asarray(x, dtype=np.int64), np.asarray(y, dtype=np.int64)
+    never = con.DIM_X + con.DIM_Y
+    to_x = np.where(dir_x > 0, con.DIM_X - x, np.where(dir_x < 0, x + 1, never))
+    to_y = np.where(dir_y > 0, con.DIM_Y - y, np.where(dir_y < 0, y + 1, never))
+    return np.minimum(to_x, to_y)
+
+
+def _free_cells(barriers: RayMap, x, y, dir_x, dir_y) -> np.ndarray:
+    # Free cells before a barrier within SHORT_PROBE_DIST; running into the world edge after
+    # e steps counts as SHORT_PROBE_DIST - e + 1 instead
+    barrier = barriers.lookup(x, y, dir_x, dir_y)
+    edge = _edge_distance(x, y, dir_x, dir_y)
+    blocked = np.minimum(barrier, edge) <= con.SHORT_PROBE_DIST
+    return np.where(
+        ~blocked, con.SHORT_PROBE_DIST, np.where(barrier < edge, barrier - 1, con.SHORT_PROBE_DIST - edge + 1)
+    )
+
+
+def short_probe(barriers: RayMap, x, y, axis_x, axis_y) -> np.ndarray:
+    """Balance of the free cells along the axis versus against it, (0, 1), 0.5 when even"""
+    forward = _free_cells(barriers, x, y, axis_x, axis_y)
+    reverse = _free_cells(barriers, x, y, -axis_x, -axis_y)
+    return (forward - reverse + con.SHORT_PROBE_DIST) / (2 * con.SHORT_PROBE_DIST)
@@ -0,0 +1,76 @@
+import numpy as np
+import constants as con
+from genome import GENE_BITS
+from grid import find_cells
+
+BACKGROUND_COLOR = (255, 255, 255)
+BARRIER_COLOR = (64, 64, 64)
+
+
+def population_colors(population) -> np.ndarray:
+    """(population, 3) uint8 RGB colors, the first and last three hex characters of each dna"""
+    genomes = population.genomes[population.genome]
+    value = ((genomes[:, 0] >> np.uint32(GENE_BITS - 12)) << np.uint32(12)) | (genomes[:, -1] & np.uint32(0xFFF))
+    return np.stack([(value >> np.uint32(16)) & 0xFF, (value >> np.uint32(8)) & 0xFF, value & 0xFF], axis=1).astype(np.uint8)
+
+
+class Renderer:
+    """Draws the world as a palette raster, cell_scale pixels per cell.
+
+    The frame is kept between calls and only the cells whose organism moved are redrawn,
+    unless a new population is drawn. When size (width, height) is not the scaled world
+    size the frame is resized with nearest neighbor sampling at the end.
+    """
+
+    def __init__(self, cell_scale: int = None, size: tuple[int, int] = None, channels: str = "RGB"):
+        self.cell_scale = cell_scale or max(1, min(con.IMG_WIDTH // con.DIM_X, con.IMG_HEIGHT // con.DIM_Y))
+        self.size = size or (con.IMG_WIDTH, con.IMG_HEIGHT)
+        self.channels = channels
+        self.frame = None
+        self._population = None
+        self._colors = None
+        self._pos_x = self._pos_y = None
+
+    def _color(self, rgb) -> np.ndarray:
+        rgb = np.asarray(rgb, dtype=np.uint8)
+        return rgb[..., ::-1] if self.channels == "BGR" else rgb
+
+    def _paint(self, x: np.ndarray, y: np.ndarray, colors: np.ndarray):
+        # Fill the cell_scale x cell_scale blocks of the given cells
+        blocks = self.frame.reshape(self.frame.shape[0] // self.cell_scale, self.cell_scale, -1, self.cell_scale, 3)
+        blocks[y, :, x, :] = colors[:, None, None, :]
+
+    def render(self, population, grid: np.ndarray) -> np.ndarray:
+        """Draw the population on grid and return the (height, width, 3) uint8 frame, which is
+        reused by the next call"""
+        height, width = grid.shape
+        full_redraw = (
+            self.frame is None
+            or population is None
+            or self.frame.shape[:2] != (height * self.cell_scale, width * self.cell_scale)
+            or population is not self._population
+            or len(population) != len(self._colors)
+        )
+        if full_redraw:
+            self.frame = np.empty((height * self.cell_scale, width * self.cell_scale, 3), dtype=np.uint8)
+            self.frame[:] = self._color(BACKGROUND_COLOR)
+            barrier_y, barrier_x = find_cells(grid, con.BARRIER_CELL)
+            self._paint(barrier_x, barrier_y, np.broadcast_to(self._color(BARRIER_COLOR), (len(barrier_x), 3)))
+            self._population = population
+            self._colors = self._color(population_colors(population)) if population is not None else np.empty((0, 3), np.uint8)
+            moved = np.ones(len(self._colors), dtype=bool)
+        else:
+            # Clear the cells organisms left, then draw them where they are now
+            moved = (population.pos_x != self._pos_x) | (population.pos_y != self._pos_y)
+            left_x, left_y = self._pos_x[moved], self._pos_y[moved]
+            vacated = grid[left_y, left_x] == con.EMPTY_CELL
+            self._paint(left_x[vacated], left_y[vacated], np.broadcast_to(self._color(BACKGROUND_COLOR), (int(vacated.sum()), 3)))
+
+        if population is not None:
+            self._paint(population.pos_x[moved], population.pos_y[moved], self._colors[moved])
+            self._pos_x, self._pos_y = population.pos_x.copy(), population.pos_y.copy()
+
+        if self.size != (self.frame.shape[1], self.frame.shape[0]):
+            import cv2
+            return cv2.resize(self.frame, self.size, interpolation=cv2.INTER_NEAREST)
+        return self.frame
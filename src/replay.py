@@ -0,0 +1,309 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+import numpy as np
+import constants as con
+from grid import ChunkedGrid
+
+_active = None
+# Worlds with more cells than this are replayed on a chunked grid
+DENSE_CELLS = 1 << 26
+
+
+class ReplayLog:
+    """Step by step record of a run, enough to redraw or analyse it without simulating again.
+
+    Every generation gets a directory under path holding the organisms' genomes and starting
+    positions as .npy files, and the move of every organism at every step as int8 (dx, dy)
+    pairs, chunk_steps steps per file. Chunks are compressed .npz files, or plain .npy files
+    that are memory-mapped when read with compress=False. A generation is written to a
+    temporary directory and only renamed into place once it ends, so an interrupted run
+    leaves whole generations behind. The barriers of the world are stored once for the run.
+    """
+
+    def __init__(self, path: str, chunk_steps: int = 256, compress: bool = True):
+        self.path = path
+        self.chunk_steps = chunk_steps
+        self.compress = compress
+        self._moves = None
+        self._world = None
+        os.makedirs(path, exist_ok=True)
+
+    def _write_world(self):
+        # The barriers and the shape of the world, rewritten when they change
+        world = {"shape": list(con.WORLD_MATRIX.shape), "barriers": len(con.BARRIER_MAP)}
+        if world != self._world:
+            np.save(os.path.join(self.path, "barriers.npy"), con.BARRIER_MAP.cells)
+            with open(os.path.join(self.path, "world.json"), "w") as file:
+                json.dump(world, file)
+            self._world = world
+
+    def begin_generation(self, population):
+        """Store the organisms of a freshly placed population"""
+        self._write_world()
+        self._directory = os.path.join(self.path, "current.tmp")
+        shutil.rmtree(self._directory, ignore_errors=True)
+        os.makedirs(self._directory)
+        np.save(os.path.join(self._directory, "genomes.npy"), population.genomes[population.genome])
+        np.save(os.path.join(self._directory, "pos_x.npy"), population.pos_x)
+        np.save(os.path.join(self._directory, "pos_y.npy"), population.pos_y)
+        self._moves = np.zeros((self.chunk_steps, 2, len(population)), dtype=np.int8)
+        self._filled = 0
+        self._chunk = 0
+        self._steps = 0
+
+    def record_step(self, move_x: np.ndarray, move_y: np.ndarray):
+        """Add the (dx, dy) every organism moved by in a step"""
+        if self._moves is None:
+            return  # Enabled in the middle of a generation
+        self._moves[self._filled, 0] = move_x
+        self._moves[self._filled, 1] = move_y
+        self._filled += 1
+        self._steps += 1
+        if self._filled == self.chunk_steps:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        if self._filled == 0:
+            return
+        chunk = os.path.join(self._directory, f"moves.{self._chunk:05d}")
+        if self.compress:
+            np.savez_compressed(chunk + ".npz", moves=self._moves[:self._filled])
+        else:
+            np.save(chunk + ".npy", self._moves[:self._filled])
+        self._chunk += 1
+        self._filled = 0
+
+    def end_generation(self, generation: int, survivors: int):
+        """Close the generation that just ended, survivors being how many passed the filter"""
+        if self._moves is None:
+            return
+        self._write_chunk()
+        with open(os.path.join(self._directory, "meta.json"), "w") as file:
+            json.dump({
+                "generation": generation,
+                "organisms": self._moves.shape[2],
+                "steps": self._steps,
+                "chunk_steps": self.chunk_steps,
+                "survivors": survivors,
+            }, file)
+        final = os.path.join(self.path, f"{generation:05d}")
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(self._directory, final)
+        self._moves = None
+
+    def close(self):
+        # A generation still being written is left out
+        if self._moves is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._moves = None
+
+
+class _Frame:
+    # The population as the renderer sees it, at one step of a replay
+    def __init__(self, genomes: np.ndarray, pos_x: np.ndarray, pos_y: np.ndarray):
+        self.genomes = genomes
+        self.genome = np.arange(len(genomes))
+        self.pos_x, self.pos_y = pos_x, pos_y
+
+    def __len__(self) -> int:
+        return len(self.genome)
+
+
+class GenerationReplay:
+    """One generation of a replay log: genomes, starting positions and moves, all read lazily"""
+
+    def __init__(self, directory: str, shape: tuple[int, int], barriers: np.ndarray):
+        self.directory = directory
+        self.shape = shape
+        self.barriers = barriers
+        with open(os.path.join(directory, "meta.json")) as file:
+            self.meta = json.load(file)
+        self.genomes = np.load(os.path.join(directory, "genomes.npy"), mmap_mode="r")
+        self.start_x = np.load(os.path.join(directory, "pos_x.npy"), mmap_mode="r")
+        self.start_y = np.load(os.path.join(directory, "pos_y.npy"), mmap_mode="r")
+        self._chunks = sorted(glob.glob(os.path.join(directory, "moves.*")))
+
+    @property
+    def steps(self) -> int:
+        return self.meta["steps"]
+
+    def __len__(self) -> int:
+        return self.meta["organisms"]
+
+    def _chunk(self, index: int) -> np.ndarray:
+        # (steps, 2, organisms) moves of a chunk, mapped when it is not compressed
+        path = self._chunks[index]
+        if path.endswith(".npy"):
+            return np.load(path, mmap_mode="r")
+        with np.load(path) as chunk:
+            return chunk["moves"]
+
+    def moves(self, first: int = 0, last: int = None):
+        """Yield (step, move_x, move_y) for steps first..last-1, step 0 being the first one
+        simulated; only the chunks holding them are read"""
+        last = self.steps if last is None else min(last, self.steps)
+        size = self.meta["chunk_steps"]
+        for index in range(first // size, -(-last // size)):
+            chunk = self._chunk(index)
+            for step in range(max(first, index * size), min(last, (index + 1) * size)):
+                yield step, chunk[step - index * size, 0], chunk[step - index * size, 1]
+
+    def positions(self, first: int = 0, last: int = None, organisms: np.ndarray = None):
+        """Yield (step, pos_x, pos_y) for the positions after step steps, step going from first
+        to last (steps by default) included, optionally only for the given organisms. The same
+        two arrays are updated in place from one step to the next."""
+        last = self.steps if last is None else min(last, self.steps)
+        rows = slice(None) if organisms is None else np.asarray(organisms)
+        pos_x = np.array(self.start_x[rows], dtype=np.int32)
+        pos_y = np.array(self.start_y[rows], dtype=np.int32)
+        if first == 0:
+            yield 0, pos_x, pos_y
+        for step, move_x, move_y in self.moves(0, last):
+            pos_x += move_x[rows]
+            pos_y += move_y[rows]
+            if step + 1 >= first:
+                yield step + 1, pos_x, pos_y
+
+    def trajectories(self, organisms: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        """(steps + 1, organisms) matrices of the x and y of the given organisms (all by default)
+        after every step"""
+        path_x, path_y = [], []
+        for _, pos_x, pos_y in self.positions(organisms=organisms):
+            path_x.append(pos_x.copy())
+            path_y.append(pos_y.copy())
+        return np.stack(path_x), np.stack(path_y)
+
+    def grid(self):
+        """An empty occupancy grid of the world with its barriers, chunked for large worlds"""
+        height, width = self.shape
+        if height * width > DENSE_CELLS:
+            grid = ChunkedGrid(self.shape, con.EMPTY_CELL, con.GRID_CHUNK)
+        else:
+            grid = np.full(self.shape, con.EMPTY_CELL, dtype=np.int32)
+        barrier_y, barrier_x = np.divmod(np.asarray(self.barriers), width)
+        grid[barrier_y, barrier_x] = con.BARRIER_CELL
+        return grid
+
+    def frames(self, first: int = 0, last: int = None, stride: int = 1, renderer=None):
+        """Yield (step, frame) for every stride-th step from first to last, drawn by renderer
+        (a render.Renderer, RGB at the world's size by default)"""
+        if renderer is None:
+            from render import Renderer
+            renderer = Renderer(cell_scale=1, size=(self.shape[1], self.shape[0]))
+        grid = self.grid()
+        frame = _Frame(self.genomes, None, None)
+        previous_x = previous_y = None
+        for step, pos_x, pos_y in self.positions(0, last):
+            # Keep the grid in step so the renderer clears the cells organisms left
+            if previous_x is not None:
+                grid[previous_y, previous_x] = con.EMPTY_CELL
+            grid[pos_y, pos_x] = np.arange(len(pos_x), dtype=np.int32)
+            previous_x, previous_y = pos_x.copy(), pos_y.copy()
+            if step >= first and (step - first) % stride == 0:
+                frame.pos_x, frame.pos_y = previous_x, previous_y
+                yield step, renderer.render(frame, grid)
+
+
+class Replay:
+    """A replay log opened for reading, generation by generation"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "world.json")) as file:
+            self.shape = tuple(json.load(file)["shape"])
+        self.barriers = np.load(os.path.join(path, "barriers.npy"), mmap_mode="r")
+
+    @property
+    def generations(self) -> list[int]:
+        return sorted(int(name) for name in os.listdir(self.path) if name.isdigit())
+
+    def __getitem__(self, generation: int) -> GenerationReplay:
+        return GenerationReplay(os.path.join(self.path, f"{generation:05d}"), self.shape, self.barriers)
+
+
+def enable(log: ReplayLog) -> ReplayLog:
+    """Make log record the simulation loop"""
+    global _active
+    _active = log
+    return log
+
+
+def disable():
+    """Stop recording and close the active log"""
+    global _active
+    if _active is not None:
+        _active.close()
+    _active = None
+
+
+def active() -> ReplayLog:
+    """The log recording now, None when replay logging is off"""
+    return _active
+
+
+def begin_generation(population):
+    if _active is not None and population is not None:
+        _active.begin_generation(population)
+
+
+def end_generation(generation: int, survivors: int):
+    if _active is not None:
+        _active.end_generation(generation, survivors)
+
+
+def _frame_name(generation: int, step: int) -> str:
+    # Named like the live snapshots (video.RecordingPolicy.snapshot_path), which number the
+    # state after step i + 1 as i; the layout before the first step has a name of its own
+    return f"world_{generation}_start.png" if step == 0 else f"world_{generation}_{step - 1}.png"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Redraw or export a recorded run without simulating it again")
+    parser.add_argument("log", help="replay log directory")
+    parser.add_argument("--generation", type=int, action="append", help="generation to replay, can be repeated (default all)")
+    parser.add_argument("--first", type=int, default=0, help="first step to draw")
+    parser.add_argument("--last", type=int, help="last step to draw (default the end of the generation)")
+    parser.add_argument("--stride", type=int, default=1, help="draw every stride-th step")
+    parser.add_argument("--scale", type=int, default=1, help="pixels per cell")
+    parser.add_argument("--size", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"), help="resize the frames to this size")
+    parser.add_argument("--video", help="encode the frames into this video file")
+    parser.add_argument("--frames", help="save every frame as a PNG file in this directory, named like the live snapshots")
+    parser.add_argument("--fps", type=int, default=con.VIDEO_FPS, help="frames per second of the video")
+    parser.add_argument("--trajectories", help="save the x and y of every organism after every step to this .npz file, one pair of arrays per generation")
+    args = parser.parse_args(argv)
+
+    replay = Replay(args.log)
+    generations = args.generation or replay.generations
+    if args.trajectories:
+        paths = {}
+        for generation in generations:
+            paths[f"x_{generation}"], paths[f"y_{generation}"] = replay[generation].trajectories()
+        np.savez_compressed(args.trajectories, **paths)
+    if not (args.video or args.frames):
+        return
+
+    from render import Renderer
+    from video import AsyncVideoWriter
+    height, width = replay.shape
+    size = tuple(args.size) if args.size else (width * args.scale, height * args.scale)
+    renderer = Renderer(cell_scale=args.scale, size=size, channels="BGR")
+    video = AsyncVideoWriter(args.video, args.fps, size) if args.video else None
+    try:
+        for generation in generations:
+            for step, frame in replay[generation].frames(args.first, args.last, args.stride, renderer):
+                if video is not None:
+                    video.write(frame)
+                if args.frames:
+                    import cv2
+                    os.makedirs(args.frames, exist_ok=True)
+                    cv2.imwrite(os.path.join(args.frames, _frame_name(generation, step)), frame)
+    finally:
+        if video is not None:
+            video.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import numpy as np
+
+# Streams of a world, spawned from its seed in this order: the per-step draws of the engine,
+# the placement of organisms, and the genomes and parents of breeding
+STREAMS = ("step", "placement", "breeding")
+
+
+class RandomStreams:
+    """Independent numpy random streams of one world, all derived from a single seed.
+
+    Every consumer draws from a Generator of its own, spawned from one SeedSequence, so
+    drawing more numbers in one place never shifts the numbers another place gets. spawn()
+    hands out further independent streams, one per worker or island, reproducible from the
+    same seed. All the draws of a step are made in one batch by the process that owns the
+    world, so a run gives the same numbers however its work is split.
+    """
+
+    def __init__(self, seed=None):
+        self.sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        for name, child in zip(STREAMS, self.sequence.spawn(len(STREAMS))):
+            setattr(self, name, np.random.Generator(np.random.PCG64(child)))
+
+    def spawn(self, count: int) -> list["RandomStreams"]:
+        """count new independent sets of streams"""
+        return [RandomStreams(child) for child in self.sequence.spawn(count)]
+
+    def uniforms(self, rows: int, count: int) -> np.ndarray:
+        """(rows, count) matrix of uniform numbers in [0, 1) from the step stream"""
+        return self.step.random((rows, count))
+
+    def free_cells(self, count: int, free: int) -> np.ndarray:
+        """count distinct ranks out of free, in random order: the start of a random permutation
+        of the free cells, drawn without building the permutation"""
+        if count > free:
+            raise ValueError(f"Cannot place {count} organisms on {free} free cells")
+        return self.placement.choice(free, size=count, replace=False)
+
+    def get_state(self) -> dict:
+        """State of every stream and of the seed sequence, as plain JSON values"""
+        return {
+            "entropy": self.sequence.entropy,
+            "spawn_key": list(self.sequence.spawn_key),
+            "children": self.sequence.n_children_spawned,
+            **{name: getattr(self, name).bit_generator.state for name in STREAMS},
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "RandomStreams":
+        sequence = np.random.SeedSequence(state["entropy"], spawn_key=tuple(state["spawn_key"]))
+        streams = cls(sequence)
+        # Spawning the streams above moved the sequence on; put it back where it was
+        streams.sequence = np.random.SeedSequence(
+            state["entropy"], spawn_key=tuple(state["spawn_key"]), n_children_spawned=state["children"]
+        )
+        for name in STREAMS:
+            getattr(streams, name).bit_generator.state = state[name]
+        return streams
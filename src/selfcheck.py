@@ -0,0 +1,112 @@
+import argparse
+import fnmatch
+import sys
+import numpy as np
+import constants as con
+from simulation import Simulation
+
+SEED = 1234
+
+# Registered checks, name -> function() returning the list of what it found wrong
+CHECKS = {}
+
+
+def check(name: str):
+    """Register function() as a check; it returns a description of every failure, none when
+    everything holds"""
+    def register(function):
+        CHECKS[name] = function
+        return function
+    return register
+
+
+@check("sensing.compute_sensors")
+def check_compute_sensors() -> list[str]:
+    # The vectorized sensors read what every organism's SensingNode reads, with and without
+    # barriers, on both grid backends
+    from sensing import SENSORY, compute_sensors
+    from sensory_neuron import SensingNode
+    from world import draw_step_uniforms
+    failures = []
+    for barriers, grid in ((None, "dense"), ("maze", "dense"), ("maze", "chunked")):
+        simulation = Simulation(
+            SEED, BRAIN_MODE="graph", DIM_X=60, DIM_Y=60, POP_SIZE=900, BARRIERS=barriers, GRID_BACKEND=grid
+        )
+        simulation.populate()
+        simulation.step(3)
+        with simulation:
+            population = simulation.population
+            population.uniforms = draw_step_uniforms(len(population))
+            sensors = compute_sensors(population, con.WORLD_MATRIX, random_values=population.uniforms[0])
+            for column, name in enumerate(SENSORY):
+                expected = np.empty(len(population), dtype=np.float32)
+                for organism in population.organisms:
+                    node = SensingNode(organism, name)
+                    node.sense()
+                    expected[organism.index] = node.output_value
+                wrong = np.flatnonzero(~np.isclose(sensors[:, column], expected, atol=1e-6))
+                if len(wrong):
+                    failures.append(
+                        f"{name} ({barriers}, {grid}): {len(wrong)} organisms differ, organism {wrong[0]} "
+                        f"reads {sensors[wrong[0], column]} instead of {expected[wrong[0]]}"
+                    )
+            population.uniforms = None
+        simulation.close()
+    return failures
+
+
+class _HighDraws:
+    # A random generator whose uniform draws are all the largest float below 1, the draw
+    # most likely to fall past the last parent
+    def __init__(self, random: np.random.Generator):
+        self.random_generator = random
+
+    def random(self, size=None):
+        return np.full(size, np.nextafter(1.0, 0.0))
+
+    def integers(self, *args, **kwargs):
+        return self.random_generator.integers(*args, **kwargs)
+
+
+@check("breeding.select_parents")
+def check_select_parents() -> list[str]:
+    # Every strategy picks existing parents, and fitness selection never picks a parent
+    # without fitness while some have it
+    from breeding import SELECTION_STRATEGIES, select_parents
+    random = np.random.default_rng(SEED)
+    cases = {
+        # Running sums lose the small weights, the pairwise sum() does not and ends up larger
+        "rounding": np.concatenate([[1e16], np.ones(999)]),
+        "single": np.eye(1, 1000, 500)[0],
+        "zero": np.zeros(1000),
+        "trailing zeros": np.concatenate([np.ones(10), np.zeros(990)]),
+    }
+    failures = []
+    for selection in SELECTION_STRATEGIES:
+        for case, fitness in cases.items():
+            for draws in (random, _HighDraws(random)):
+                for parents in select_parents(1000, fitness, selection, draws):
+                    if parents.min() < 0 or parents.max() >= len(fitness):
+                        failures.append(f"{selection} ({case}): parent {parents.max()} out of {len(fitness)}")
+                    elif selection == "fitness" and fitness.any() and not fitness[parents].all():
+                        failures.append(f"{selection} ({case}): picked parents without fitness")
+    return failures
+
+
+def run_checks(pattern: str = "*") -> dict:
+    """Run the checks whose name matches pattern, return their failures keyed by name"""
+    return {name: function() for name, function in CHECKS.items() if fnmatch.fnmatch(name, pattern)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that the simulator's fast paths agree with the reference ones")
+    parser.add_argument("--only", default="*", help="glob of the check names to run")
+    args = parser.parse_args()
+
+    results = run_checks(args.only)
+    for name, failures in results.items():
+        print(f"{name}: {'FAIL' if failures else 'ok'}", file=sys.stderr)
+        for failure in failures:
+            print(f"  {failure}", file=sys.stderr)
+    if any(results.values()):
+        sys.exit(1)
@@ -0,0 +1,157 @@
+import time
+import numpy as np
+import constants as con
+import profiling
+from brain import SENSORY
+from fields import neighborhood_sums
+from rays import OccupancyRays, long_probe, short_probe
+
+
+def forward_neighbor(population, grid: np.ndarray, readers: np.ndarray) -> np.ndarray:
+    """Index of the organism in the cell in front of each reader, EMPTY_CELL if there is none"""
+    target_x = population.pos_x[readers] + population.dir_x[readers]
+    target_y = population.pos_y[readers] + population.dir_y[readers]
+    inside = (target_x >= 0) & (target_x < con.DIM_X) & (target_y >= 0) & (target_y < con.DIM_Y)
+    neighbor = np.full(len(readers), con.EMPTY_CELL, dtype=np.int32)
+    neighbor[inside] = grid[target_y[inside], target_x[inside]]
+    return neighbor
+
+
+def genetic_similarity_fwd(population, grid: np.ndarray, readers: np.ndarray, step_cache: dict) -> np.ndarray:
+    # Genetic similarity of the organism directly forward (0 if no one's there)
+    neighbor = forward_neighbor(population, grid, readers)
+    found = neighbor >= 0
+    values = np.zeros(len(readers), dtype=np.float32)
+    values[found] = population.similarity.lookup(
+        population.genome[readers[found]], population.genome[neighbor[found]]
+    )
+    return values
+
+
+def neighborhood(population, grid: np.ndarray, step_cache: dict) -> tuple[np.ndarray, ...]:
+    # Neighborhood count and population pull of the organisms in step_cache["rows"], computed
+    # once per step into population-sized arrays
+    if "neighborhood" not in step_cache:
+        rows = step_cache["rows"]
+        sums = neighborhood_sums(
+            grid, population.pos_x[rows], population.pos_y[rows], con.SENSOR_RADIUS_POP, reads=len(population)
+        )
+        step_cache["neighborhood"] = tuple(np.zeros(len(population), dtype=part.dtype) for part in sums)
+        for full, part in zip(step_cache["neighborhood"], sums):
+            full[rows] = part
+    return step_cache["neighborhood"]
+
+
+def pop_density(population, grid: np.ndarray, readers: np.ndarray, step_cache: dict) -> np.ndarray:
+    # Population density in surrounding area
+    count = neighborhood(population, grid, step_cache)[0][readers]
+    return count / ((con.SENSOR_RADIUS_POP * 2 + 1) ** 2 - 1)
+
+
+def pop_density_fwd(population, grid: np.ndarray, readers: np.ndarray, step_cache: dict) -> np.ndarray:
+    # Population pull along the facing direction, 0.5 when balanced
+    _, pull_x, pull_y = neighborhood(population, grid, step_cache)
+    count = population.dir_x[readers] * pull_x[readers] + population.dir_y[readers] * pull_y[readers]
+    return (count / (3 * (2 * con.SENSOR_RADIUS_POP + 1)) + 1) / 2
+
+
+def pop_density_lr(population, grid: np.ndarray, readers: np.ndarray, step_cache: dict) -> np.ndarray:
+    # Population pull along the left-right axis, 0.5 when balanced
+    _, pull_x, pull_y = neighborhood(population, grid, step_cache)
+    count = -population.dir_y[readers] * pull_x[readers] + population.dir_x[readers] * pull_y[readers]
+    return (count / (3 * (2 * con.SENSOR_RADIUS_POP + 1)) + 1) / 2
+
+
+def long_range_population_fwd(population, grid: np.ndarray, readers: np.ndarray, step_cache: dict) -> np.ndarray:
+    # Closeness of the next organism in the forward direction
+    return long_probe(
+        OccupancyRays(grid), population.pos_x[readers], population.pos_y[readers],
+        population.dir_x[readers], population.dir_y[readers],
+    )
+
+
+def longprobe_barrier_fwd(population, grid: np.ndarray, readers: np.ndarray, step_cache: dict) -> np.ndarray:
+    # Closeness of the next barrier in the forward direction
+    return long_probe(
+        con.BARRIER_RAYS, population.pos_x[readers], population.pos_y[readers],
+        population.dir_x[readers], population.dir_y[readers],
+    )
+
+
+def barrier_fwd(population, grid: np.ndarray, readers: np.ndarray, step_cache: dict) -> np.ndarray:
+    # How far away a barrier is in the forward direction
+    return short_probe(
+        con.BARRIER_RAYS, population.pos_x[readers], population.pos_y[readers],
+        population.dir_x[readers], population.dir_y[readers],
+    )
+
+
+def barrier_lr(population, grid: np.ndarray, readers: np.ndarray, step_cache: dict) -> np.ndarray:
+    # How far away a barrier is in the left-right direction
+    return short_probe(
+        con.BARRIER_RAYS, population.pos_x[readers], population.pos_y[readers],
+        -population.dir_y[readers], population.dir_x[readers],
+    )
+
+
+# Vectorized probe sensors, function(population, grid, readers, step_cache) -> values for the
+# readers; step_cache holds the world-wide fields shared by the sensors of one step
+PROBES = {
+    "GENETIC_SIMILARITY_FWD": genetic_similarity_fwd,
+    "POP_DENSITY": pop_density,
+    "POP_DENSITY_FWD": pop_density_fwd,
+    "POP_DENSITY_LR": pop_density_lr,
+    "LONG_RANGE_POPULATION_FWD": long_range_population_fwd,
+    "LONGPROBE_BARRIER_FWD": longprobe_barrier_fwd,
+    "BARRIER_FWD": barrier_fwd,
+    "BARRIER_LR": barrier_lr,
+}
+
+
+def compute_sensors(population, grid: np.ndarray, uses_sensor: np.ndarray = None, rows: np.ndarray = None,
+                    random_values: np.ndarray = None) -> np.ndarray:
+    """Compute the (rows, sensory) input matrix for the current step, rows being the organism
+    indices to compute (everyone by default).
+
+    Positional sensors are computed for every row at once. Probe sensors are only
+    computed where uses_sensor (population, sensory) says some brain reads them,
+    all of them in one vectorized pass. random_values feeds the RANDOM sensor of the
+    rows, fresh draws are used when it is None.
+    """
+    rows = np.arange(len(population)) if rows is None else np.asarray(rows)
+    pos_x = population.pos_x[rows].astype(np.float64)
+    pos_y = population.pos_y[rows].astype(np.float64)
+    dir_x, dir_y = population.dir_x[rows], population.dir_y[rows]
+    period = population.oscillator_period[rows]
+    bound_x = np.minimum(pos_x, con.DIM_X - pos_x - 1)
+    bound_y = np.minimum(pos_y, con.DIM_Y - pos_y - 1)
+    phase = (con.SIMULATION_STEP % period) / period
+
+    values = {
+        "POS_X_AXIS": pos_x / con.DIM_X,
+        "POS_Y_AXIS": pos_y / con.DIM_Y,
+        "CLOSEST_BOUND_X": bound_x / int(con.DIM_X / 2 - 1),
+        "CLOSEST_BOUND_Y": bound_y / int(con.DIM_Y / 2 - 1),
+        "CLOSEST_BOUND": 2 * np.minimum(bound_x, bound_y) / int(max(con.DIM_X / 2 - 1, con.DIM_Y / 2 - 1)),
+        "PREV_MOVE_DIR_X": (dir_x + 1) / 2,
+        "PREV_MOVE_DIR_Y": (dir_y + 1) / 2,
+        "OSCILLATOR": np.clip((np.cos(phase * 2 * np.pi) + 1) / 2, 0, 1),
+        "AGE": np.full(len(rows), con.SIMULATION_STEP / con.STEPS_PER_GEN),
+        "RANDOM": con.RANDOM_STREAMS.uniforms(1, len(rows))[0] if random_values is None else random_values,
+    }
+
+    sensors = np.zeros((len(rows), len(SENSORY)), dtype=np.float32)
+    step_cache = {"rows": rows}
+    profiler = profiling.active()
+    for column, name in enumerate(SENSORY):
+        if name in values:
+            sensors[:, column] = values[name]
+        elif name in PROBES:
+            reading = np.arange(len(rows)) if uses_sensor is None else np.flatnonzero(uses_sensor[rows, column])
+            started = time.perf_counter_ns() if profiler is not None else 0
+            sensors[reading, column] = PROBES[name](population, grid, rows[reading], step_cache)
+            if profiler is not None:
+                profiler.sensor(name, time.perf_counter_ns() - started, len(reading))
+        else:
+            raise TypeError(f"Invalid sensory neuron {name}")
+    return sensors
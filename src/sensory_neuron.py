@@ -1,12 +1,26 @@
 from neural_node import NeuralNode
 import math
-import random
+import time
 import constants
+import profiling
 import utils
+import numpy as np
+from fields import neighborhood_sums
+from rays import OccupancyRays, long_probe, short_probe
 
 class SensingNode(NeuralNode):
     def compute_output(self):
         """Compute the output for the sensing node"""
+        profiler = profiling.active()
+        if profiler is None:
+            self.sense()
+        else:
+            started = time.perf_counter_ns()
+            self.sense()
+            profiler.sensor(self.identifier, time.perf_counter_ns() - started)
+
+    def sense(self):
+        # Read the sensor this node stands for into output_value
         match self.identifier:
             case "POS_X_AXIS":
                 # Position on the x-axis
@@ -19,7 +33,7 @@ class SensingNode(NeuralNode):
                 self.output_value = min(
                     self.organism.pos_x, constants.DIM_X - self.organism.pos_x - 1
                 ) / int(constants.DIM_X / 2 - 1)
-            case "CLOSEST_BOUND_X":
+            case "CLOSEST_BOUND_Y":
                 # Distance to the closest boundary on the y-axis
                 self.output_value = min(
                     self.organism.pos_y, constants.DIM_Y - self.organism.pos_y - 1
@@ -43,28 +57,13 @@ class SensingNode(NeuralNode):
                     self.organism.pos_x + self.organism.dir_x,
                     self.organism.pos_y + self.organism.dir_y,
                 )
-                from organism import Organism
-                if utils.is_within_world_limits(target_x, target_y) and type(constants.WORLD_MATRIX[target_y][target_x]) == Organism:
+                if utils.is_within_world_limits(target_x, target_y) and constants.WORLD_MATRIX[target_y, target_x] >= 0:
                     # Returns how many bits are different, scaled to (0, 1)
-                    dna1 = "".join(
-                        [
-                            bin(int(gene, 16))[2:].zfill(24)
-                            for gene in self.organism.dna.split(" ")
-                        ]
-                    )
-                    dna2 = "".join(
-                        [
-                            bin(int(gene, 16))[2:].zfill(24)
-                            for gene in constants.WORLD_MATRIX[target_y][target_x].dna.split(" ")
-                        ]
-                    )
-
-                    N = 0
-                    L = len(dna1)
-                    for i in range(L):
-                        if dna1[i] != dna2[i]:
-                            N += 1
-                    self.output_value = 1 - min(1, (2 * N) / L)
+                    population = self.organism.population
+                    self.output_value = float(population.similarity.lookup(
+                        population.genome[[self.organism.index]],
+                        population.genome[[constants.WORLD_MATRIX[target_y, target_x]]],
+                    )[0])
             case "PREV_MOVE_DIR_X":
                 # Direction on the x-axis
                 self.output_value = (self.organism.dir_x + 1) / 2
@@ -73,95 +72,25 @@ class SensingNode(NeuralNode):
                 self.output_value = (self.organism.dir_y + 1) / 2
             case "LONG_RANGE_POPULATION_FWD":
                 # Distance to an organism in the forward direction
-                for d in range(1, constants.LONG_RANGE_DIST):
-                    target_x = self.organism.pos_x + d * self.organism.dir_x
-                    target_y = self.organism.pos_y + d * self.organism.dir_y
-                    from organism import Organism
-                    if utils.is_within_world_limits(target_x, target_y) and type(constants.WORLD_MATRIX[target_y][target_x]) == Organism:
-                        self.output_value = (
-                            constants.LONG_RANGE_DIST - d + 1
-                        ) / constants.LONG_RANGE_DIST
-                        break
-                self.output_value = 0
+                self.output_value = self.probe(long_probe, OccupancyRays(constants.WORLD_MATRIX), self.organism.dir_x, self.organism.dir_y)
             case "LONGPROBE_BARRIER_FWD":
                 # Distance to a barrier in the forward direction
-                for d in range(1, constants.LONG_RANGE_DIST):
-                    target_x = self.organism.pos_x + d * self.organism.dir_x
-                    target_y = self.organism.pos_y + d * self.organism.dir_y
-                    if utils.is_within_world_limits(target_x, target_y) and constants.WORLD_MATRIX[target_y][target_x] == "B":
-                        self.output_value = (
-                            constants.LONG_RANGE_DIST - d + 1
-                        ) / constants.LONG_RANGE_DIST
-                        break
-                self.output_value = 0
+                self.output_value = self.probe(long_probe, constants.BARRIER_RAYS, self.organism.dir_x, self.organism.dir_y)
             case "POP_DENSITY":
                 # Population density in surrounding area
-                count = 0
-                for delta_x in range(
-                    -constants.SENSOR_RADIUS_POP, constants.SENSOR_RADIUS_POP + 1
-                ):
-                    for delta_y in range(
-                        -constants.SENSOR_RADIUS_POP, constants.SENSOR_RADIUS_POP + 1
-                    ):
-                        if delta_x == 0 and delta_y == 0:
-                            continue
-                        target_x = self.organism.pos_x + delta_x
-                        target_y = self.organism.pos_y + delta_y
-                        from organism import Organism
-                        if (
-                            utils.is_within_world_limits(target_x, target_y)
-                            and type(constants.WORLD_MATRIX[target_y][target_x]) == Organism
-                        ):
-                            count += 1
+                count, _, _ = self.neighborhood()
                 self.output_value = count / ((constants.SENSOR_RADIUS_POP * 2 + 1) ** 2 - 1)
             case "POP_DENSITY_FWD":
-                count = 0
-                for delta_x in range(
-                    -constants.SENSOR_RADIUS_POP, constants.SENSOR_RADIUS_POP + 1
-                ):
-                    for delta_y in range(
-                        -constants.SENSOR_RADIUS_POP, constants.SENSOR_RADIUS_POP + 1
-                    ):
-                        if delta_x == 0 and delta_y == 0:
-                            continue
-                        target_x = self.organism.pos_x + delta_x
-                        target_y = self.organism.pos_y + delta_y
-                        from organism import Organism
-                        if (
-                            utils.is_within_world_limits(target_x, target_y)
-                            and type(constants.WORLD_MATRIX[target_y][target_x]) == Organism
-                        ):
-                            count += (
-                                self.organism.dir_x * delta_x
-                                + self.organism.dir_y * delta_y
-                            ) / (delta_x * delta_x + delta_y * delta_y)
+                # Population pull along the facing direction, 0.5 when balanced
+                _, pull_x, pull_y = self.neighborhood()
+                count = self.organism.dir_x * pull_x + self.organism.dir_y * pull_y
                 max_sum = 3 * (2 * constants.SENSOR_RADIUS_POP + 1)
-                assert count >= -max_sum and count <= max_sum
                 self.output_value = (count / max_sum + 1) / 2
             case "POP_DENSITY_LR":
                 # Similar to the POPULATION_FWD neuron, but for left-right direction
-                count = 0
-                for delta_x in range(
-                    -constants.SENSOR_RADIUS_POP, constants.SENSOR_RADIUS_POP + 1
-                ):
-                    for delta_y in range(
-                        -constants.SENSOR_RADIUS_POP, constants.SENSOR_RADIUS_POP + 1
-                    ):
-                        if delta_x == 0 and delta_y == 0:
-                            continue
-                        target_x = -self.organism.dir_y + delta_x
-                        target_y = self.organism.dir_x + delta_y
-                        from organism import Organism
-                        if (
-                            utils.is_within_world_limits(target_x, target_y)
-                            and type(constants.WORLD_MATRIX[target_y][target_x]) == Organism
-                        ):
-                            count += (
-                                -self.organism.dir_y * delta_x
-                                + self.organism.dir_x * delta_y
-                            ) / (delta_x * delta_x + delta_y * delta_y)
+                _, pull_x, pull_y = self.neighborhood()
+                count = -self.organism.dir_y * pull_x + self.organism.dir_x * pull_y
                 max_sum = 3 * (2 * constants.SENSOR_RADIUS_POP + 1)
-                assert count >= -max_sum and count <= max_sum
                 self.output_value = (count / max_sum + 1) / 2
             case "OSCILLATOR":
                 # Output of a cos function with phase determined by organism's age
@@ -175,47 +104,32 @@ class SensingNode(NeuralNode):
                 self.output_value = constants.SIMULATION_STEP / constants.STEPS_PER_GEN
             case "BARRIER_FWD":
                 # How far away a barrier is in the forward direction
-                self.output_value = self.calculate_sensor_range(
-                    self.organism.dir_x, self.organism.dir_y
-                )
+                self.output_value = self.probe(short_probe, constants.BARRIER_RAYS, self.organism.dir_x, self.organism.dir_y)
             case "BARRIER_LR":
                 # How far away a barrier is in the left-right direction
-                self.output_value = self.calculate_sensor_range(
-                    -self.organism.dir_y, self.organism.dir_x
-                )
+                self.output_value = self.probe(short_probe, constants.BARRIER_RAYS, -self.organism.dir_y, self.organism.dir_x)
             case "RANDOM":
-                # random float in (0, 1), uniform
-                self.output_value = random.random()
+                # random float in [0, 1), uniform, drawn with the step
+                self.output_value = self.organism.uniform(0)
             case _:
                 raise TypeError(f"Invalid sensory neuron {self.identifier}")
 
-    def calculate_sensor_range(self, x_axis: int, y_axis: int):
-        count_fwd = 0
-        count_rev = 0
-        num_locs_to_test = constants.SHORT_PROBE_DIST
-
-        tx, ty = self.organism.pos_x + x_axis, self.organism.pos_y + y_axis
-        while (
-            num_locs_to_test > 0 and utils.is_within_world_limits(tx, ty) and constants.WORLD_MATRIX[ty][tx] != "B"
-        ):
-            count_fwd += 1
-            tx += x_axis
-            ty += y_axis
-            num_locs_to_test -= 1
-        if num_locs_to_test > 0 and not utils.is_within_world_limits(tx, ty):
-            count_fwd = num_locs_to_test
-
-        num_locs_to_test = constants.SHORT_PROBE_DIST
-        tx, ty = self.organism.pos_x - x_axis, self.organism.pos_y - y_axis
-        while (
-            num_locs_to_test > 0 and utils.is_within_world_limits(tx, ty) and constants.WORLD_MATRIX[ty][tx] != "B"
-        ):
-            count_rev += 1
-            tx -= x_axis
-            ty -= y_axis
-            num_locs_to_test -= 1
-        if num_locs_to_test > 0 and not utils.is_within_world_limits(tx, ty):
-            count_rev = num_locs_to_test
-        return (count_fwd - count_rev + constants.SHORT_PROBE_DIST) / (
-            2 * constants.SHORT_PROBE_DIST
+    def neighborhood(self) -> tuple[float, float, float]:
+        # Occupied cells around the organism and the population pull towards +x and +y
+        count, pull_x, pull_y = neighborhood_sums(
+            constants.WORLD_MATRIX,
+            np.array([self.organism.pos_x]),
+            np.array([self.organism.pos_y]),
+            constants.SENSOR_RADIUS_POP,
         )
+        return int(count[0]), float(pull_x[0]), float(pull_y[0])
+
+    def probe(self, probe, rays, axis_x: int, axis_y: int) -> float:
+        # Read a rays probe function for this organism only
+        return float(probe(
+            rays,
+            np.array([self.organism.pos_x]),
+            np.array([self.organism.pos_y]),
+            np.array([axis_x]),
+            np.array([axis_y]),
+        )[0])
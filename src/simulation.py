@@ -0,0 +1,168 @@
+import concurrent.futures
+import itertools
+import numpy as np
+import constants as con
+import parallel
+from checkpoint import Checkpoint, resume_checkpoint, save_checkpoint
+import world
+
+# Module globals that make up the state of one world, next to its config
+WORLD_STATE = ("WORLD_MATRIX", "POPULATION", "BARRIER_MAP", "BARRIER_RAYS", "RANDOM_STREAMS", "SIMULATION_STEP")
+
+# The simulation whose state is in constants now, None outside of any
+_installed = None
+
+# Settings the genome and brain layouts are derived from when the modules are imported, the
+# same for every simulation of a process
+FIXED_SETTINGS = ("LENGTH_GENE", "ID_BITS_COUNT", "MAX_INNER_NEURON", "MAX_WEIGHT_VAL", "NEURON_TYPES")
+
+
+def default_config() -> dict:
+    """Every setting of constants as it is now, the world state left out"""
+    return {
+        key: value for key, value in vars(con).items()
+        if key.isupper() and key not in WORLD_STATE and not isinstance(value, np.ndarray)
+    }
+
+
+class Simulation:
+    """One world with its own grid, population, step counter, config and random state.
+
+    The engine modules read the world through constants, so a simulation installs its
+    state there while it runs (inside ``with simulation:`` or any of its methods) and
+    takes it back out afterwards. Any number of simulations can live in one interpreter
+    and take turns, and none of them is affected by changes made to constants after it
+    was created.
+    """
+
+    def __init__(self, seed: int = None, survival=None, **config):
+        self.config = default_config()
+        for key, value in config.items():
+            if key not in self.config:
+                raise ValueError(f"Unknown setting {key}")
+            if key in FIXED_SETTINGS and value != self.config[key]:
+                raise ValueError(f"{key} cannot change per simulation, set it in constants before starting")
+            self.config[key] = value
+        # The video frame follows the world size, as on the command line
+        self.config["IMG_WIDTH"], self.config["IMG_HEIGHT"] = self.config["DIM_X"] * 8, self.config["DIM_Y"] * 8
+        self.seed = seed
+        self.config["SEED"] = seed
+        self.survival = survival or con.check_survival  # function(pos_x, pos_y) -> mask of survivors
+        self.generation = 0
+        self.state = dict.fromkeys(WORLD_STATE)
+        self._engine = None
+        self._saved = []
+        with self:
+            world.initialize_environment()
+
+    def __enter__(self):
+        global _installed
+        if _installed is self:
+            # Already installed, e.g. a method called inside ``with simulation:``
+            self._saved.append(None)
+            return self
+        saved = {key: getattr(con, key) for key in (*self.config, *WORLD_STATE, "check_survival")}
+        for key, value in (*self.config.items(), *self.state.items()):
+            setattr(con, key, value)
+        con.check_survival = self.survival
+        saved["engine"], parallel._engine = parallel._engine, self._engine
+        saved["installed"], _installed = _installed, self
+        self._saved.append(saved)
+        return self
+
+    def __exit__(self, *exc_info):
+        global _installed
+        saved = self._saved.pop()
+        if saved is None:
+            return
+        self.state = {key: getattr(con, key) for key in WORLD_STATE}
+        self._engine, parallel._engine = parallel._engine, saved.pop("engine")
+        _installed = saved.pop("installed")
+        for key, value in saved.items():
+            setattr(con, key, value)
+
+    @property
+    def step_count(self) -> int:
+        return self.state["SIMULATION_STEP"]
+
+    @property
+    def population(self):
+        return self.state["POPULATION"]
+
+    def populate(self, genomes: np.ndarray = None):
+        """Place organisms with the given genome matrix, random genomes if none are given"""
+        with self:
+            world.populate_creatures(genomes)
+
+    def step(self, count: int = 1):
+        """Advance the world by count steps"""
+        with self:
+            for _ in range(count):
+                world.simulate_world()
+
+    def run_generation(self) -> int:
+        """Breed (or populate) the world, run one generation of STEPS_PER_GEN steps (fewer when it
+        stagnates, see STAGNATION_STEPS) and keep the survivors; return how many survived"""
+        with self:
+            world.start_generation()
+            for _ in world.simulate_generation():
+                pass
+            world.filter_surviving_creatures()
+            self.generation += 1
+            return world.population_size()
+
+    def run(self, generations: int) -> list[int]:
+        """Run several generations, return the survivor count of each"""
+        return [self.run_generation() for _ in range(generations)]
+
+    def save(self, path: str):
+        """Write a checkpoint of this simulation"""
+        with self:
+            save_checkpoint(path, self.generation)
+
+    @classmethod
+    def resume(cls, path: str, survival=None):
+        """A simulation continuing from a checkpoint, with the settings saved in it"""
+        simulation = cls(None, survival, **Checkpoint(path).metadata["settings"])
+        with simulation:
+            simulation.generation = resume_checkpoint(path)
+        return simulation
+
+    def close(self):
+        """Stop the parallel engine of this simulation, if it started one"""
+        if self._engine is not None:
+            with self:
+                self._engine.close()
+            self._engine = None
+
+
+def run_one(run: dict) -> dict:
+    """Run one sweep entry {"seed", "generations", "survival", setting: value, ...} and
+    return it with the survivor count of every generation"""
+    settings = {key: value for key, value in run.items() if key not in ("seed", "generations", "survival")}
+    simulation = Simulation(run.get("seed"), run.get("survival"), **settings)
+    try:
+        survivors = simulation.run(run.get("generations", 1))
+    finally:
+        simulation.close()
+    return {**run, "survivors": survivors, "survival_rate": [count / simulation.config["POP_SIZE"] for count in survivors]}
+
+
+def sweep(seeds, generations: int = 1, **values) -> list[dict]:
+    """Sweep entries for every seed and every combination of the given setting values, e.g.
+    sweep(range(10), MUTATION_RATE=[0.001, 0.01], SENSOR_RADIUS_POP=[2, 4])"""
+    keys = list(values)
+    return [
+        {"seed": seed, "generations": generations, **dict(zip(keys, combination))}
+        for seed in seeds
+        for combination in itertools.product(*(values[key] for key in keys))
+    ]
+
+
+def run_sweep(runs: list[dict], processes: int = None) -> list[dict]:
+    """Run every sweep entry in a pool of processes, results in the order of runs. Survival
+    functions must be picklable, i.e. defined at module level."""
+    if processes == 1:
+        return [run_one(run) for run in runs]
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(run_one, runs))
@@ -0,0 +1,176 @@
+import csv
+import os
+import numpy as np
+import constants as con
+from genome import popcount
+
+_active = None
+
+
+def _unique_genomes(genomes: np.ndarray) -> int:
+    # Distinct rows of a genome matrix, each row compared as one opaque value
+    rows = np.ascontiguousarray(genomes).view(np.dtype((np.void, genomes.dtype.itemsize * genomes.shape[1])))
+    return len(np.unique(rows))
+
+
+def _neuron_usage(population) -> tuple[np.ndarray, np.ndarray]:
+    # Organisms whose brain reads each sensor and drives each action
+    sensory, action = con.NEURON_TYPES["sensory"], con.NEURON_TYPES["action"]
+    if population.brains is not None:
+        brains = population.brains
+        carriers = np.bincount(brains.brain, minlength=len(brains.uses_sensor))
+        return carriers @ brains.uses_sensor, carriers @ brains.has_action
+    sensors, actions = np.zeros(len(sensory), dtype=np.int64), np.zeros(len(action), dtype=np.int64)
+    for organism in population.organisms:
+        sensors[[sensory.index(name) for name in organism.neurons["sensory"]]] += 1
+        actions[[action.index(name) for name in organism.neurons["action"]]] += 1
+    return sensors, actions
+
+
+class StatsLog:
+    """Per-generation statistics, gathered while the engine runs and appended to a log.
+
+    A path ending in .csv gets one row per generation, flushed right away so it can be
+    tailed. Any other path is the prefix of .npz files holding chunk_size generations
+    each, column by column. Everything is computed from the population arrays, never
+    from the grid; the mean Hamming distance comes from sample_pairs random pairs drawn
+    from a generator of its own, so logging does not change the run.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 100, sample_pairs: int = 1024, seed: int = 0):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.sample_pairs = sample_pairs
+        self.random = np.random.default_rng(seed)
+        self.columns = [
+            "generation", "population", "survivors", "survival_rate", "unique_genomes", "mean_hamming",
+            "moves_per_step", "move_rate", "steps", "stopped_early",
+            *(f"sensor_{name}" for name in con.NEURON_TYPES["sensory"]),
+            *(f"action_{name}" for name in con.NEURON_TYPES["action"]),
+        ]
+        self._rows = []
+        self._chunk = 0
+        while os.path.exists(f"{path}.{self._chunk:05d}.npz"):
+            self._chunk += 1  # Continue after the chunks of a resumed run
+        self._begin = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._csv = None
+        if path.endswith(".csv"):
+            new = not os.path.exists(path) or os.path.getsize(path) == 0
+            self._file = open(path, "a", newline="")
+            self._csv = csv.writer(self._file)
+            if new:
+                self._csv.writerow(self.columns)
+                self._file.flush()
+
+    def begin_generation(self, population):
+        """Take the figures of a freshly placed population"""
+        genomes = population.genomes[population.genome]
+        mean_hamming = float("nan")
+        if len(genomes) > 1:
+            # Pairs of two different organisms
+            first = self.random.integers(len(genomes), size=self.sample_pairs)
+            second = (first + self.random.integers(1, len(genomes), size=self.sample_pairs)) % len(genomes)
+            mean_hamming = float(popcount(genomes[first] ^ genomes[second]).sum(axis=1).mean())
+        sensors, actions = _neuron_usage(population)
+        self._begin = {
+            "population": len(population),
+            "unique_genomes": _unique_genomes(genomes) if len(genomes) else 0,
+            "mean_hamming": mean_hamming,
+            "sensors": sensors.tolist(),
+            "actions": actions.tolist(),
+        }
+        self._steps = 0
+        self._moves = 0
+        self._organism_steps = 0
+        self._stopped_early = False
+
+    def record_step(self, moved: int, organisms: int):
+        """Count a step in which moved of the organisms changed cells"""
+        self._steps += 1
+        self._moves += moved
+        self._organism_steps += organisms
+
+    def stopped_early(self):
+        """Note that the generation ends before STEPS_PER_GEN because it stagnated"""
+        self._stopped_early = True
+
+    def end_generation(self, generation: int, survivors: int) -> dict:
+        """Log the generation that just ended, survivors being how many passed the filter"""
+        begin = self._begin or {"population": 0, "unique_genomes": 0, "mean_hamming": float("nan"), "sensors": [], "actions": []}
+        row = {
+            "generation": generation,
+            "population": begin["population"],
+            "survivors": survivors,
+            "survival_rate": survivors / begin["population"] if begin["population"] else 0.0,
+            "unique_genomes": begin["unique_genomes"],
+            "mean_hamming": begin["mean_hamming"],
+            "moves_per_step": self._moves / self._steps if self._begin and self._steps else 0.0,
+            "move_rate": self._moves / self._organism_steps if self._begin and self._organism_steps else 0.0,
+            "steps": self._steps if self._begin else 0,
+            "stopped_early": int(bool(self._begin) and self._stopped_early),
+        }
+        names = [column for column in self.columns if column.startswith(("sensor_", "action_"))]
+        row.update(zip(names, begin["sensors"] + begin["actions"]))
+        self._begin = None
+
+        if self._csv is not None:
+            self._csv.writerow([row.get(column, 0) for column in self.columns])
+            self._file.flush()
+        else:
+            self._rows.append(row)
+            if len(self._rows) >= self.chunk_size:
+                self._write_chunk()
+        return row
+
+    def _write_chunk(self):
+        if not self._rows:
+            return
+        np.savez(
+            f"{self.path}.{self._chunk:05d}.npz",
+            **{column: np.array([row.get(column, 0) for row in self._rows]) for column in self.columns},
+        )
+        self._chunk += 1
+        self._rows = []
+
+    def close(self):
+        if self._csv is not None:
+            self._file.close()
+            self._csv = None
+        else:
+            self._write_chunk()
+
+
+def enable(log: StatsLog) -> StatsLog:
+    """Make log collect from the simulation loop"""
+    global _active
+    _active = log
+    return log
+
+
+def disable():
+    """Stop collecting and close the active log"""
+    global _active
+    if _active is not None:
+        _active.close()
+    _active = None
+
+
+def active() -> StatsLog:
+    """The log collecting now, None when statistics are off"""
+    return _active
+
+
+def begin_generation(population):
+    if _active is not None and population is not None:
+        _active.begin_generation(population)
+
+
+def stopped_early():
+    if _active is not None:
+        _active.stopped_early()
+
+
+def end_generation(generation: int, survivors: int):
+    if _active is not None:
+        _active.end_generation(generation, survivors)
@@ -0,0 +1,189 @@
+import abc
+import functools
+import numpy as np
+import constants as con
+from grid import test_bits
+
+# Rows of the world evaluated at once when compiling a zone, bounding the memory it takes
+COMPILE_ROWS = 256
+
+
+class Zone(abc.ABC):
+    """A region of the world where organisms survive, in cell coordinates.
+
+    Zones combine with | (either), & (both), - (the first but not the second) and ~ (outside).
+    However a zone is built, compile() evaluates it once over the world into one bit per cell,
+    so the end of generation filter is a single lookup per organism. Calling a zone with
+    (pos_x, pos_y) does that for the world currently set up, like check_survival in constants.
+    """
+
+    @abc.abstractmethod
+    def contains(self, x: np.ndarray, y: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+        """Whether every (x, y) of a world of shape (height, width) lies in the zone"""
+
+    def __or__(self, other: "Zone") -> "Zone":
+        return Union(self, other)
+
+    def __and__(self, other: "Zone") -> "Zone":
+        return Intersection(self, other)
+
+    def __sub__(self, other: "Zone") -> "Zone":
+        return Intersection(self, Outside(other))
+
+    def __invert__(self) -> "Zone":
+        return Outside(self)
+
+    def compile(self, shape: tuple[int, int]) -> "SurvivalMask":
+        return _compiled(self, tuple(shape))
+
+    def __call__(self, pos_x: np.ndarray, pos_y: np.ndarray) -> np.ndarray:
+        return self.compile((con.DIM_Y, con.DIM_X))(pos_x, pos_y)
+
+
+class SurvivalMask:
+    """A zone compiled for one world size, one bit per cell packed along x"""
+
+    def __init__(self, bits: np.ndarray, shape: tuple[int, int]):
+        self.bits = bits
+        self.shape = shape
+
+    @property
+    def area(self) -> int:
+        """Number of cells in the zone"""
+        return int(np.unpackbits(self.bits, axis=1, count=self.shape[1]).sum())
+
+    def __call__(self, pos_x: np.ndarray, pos_y: np.ndarray) -> np.ndarray:
+        return test_bits(self.bits, pos_x, pos_y)
+
+
+@functools.lru_cache(maxsize=16)
+def _compiled(zone: Zone, shape: tuple[int, int]) -> SurvivalMask:
+    # Evaluate the zone a block of rows at a time and pack every block into bits
+    height, width = shape
+    bits = np.empty((height, -(-width // 8)), dtype=np.uint8)
+    for top in range(0, height, COMPILE_ROWS):
+        y, x = np.mgrid[top:min(top + COMPILE_ROWS, height), 0:width]
+        bits[top:top + len(y)] = np.packbits(np.asarray(zone.contains(x, y, shape), dtype=bool), axis=1)
+    return SurvivalMask(bits, shape)
+
+
+class Rectangle(Zone):
+    """Cells with left <= x < right and top <= y < bottom"""
+
+    def __init__(self, left: int, top: int, right: int, bottom: int):
+        self.left, self.top, self.right, self.bottom = left, top, right, bottom
+
+    def contains(self, x, y, shape):
+        return (x >= self.left) & (x < self.right) & (y >= self.top) & (y < self.bottom)
+
+
+class Circle(Zone):
+    """Cells within radius of (center_x, center_y)"""
+
+    def __init__(self, center_x: float, center_y: float, radius: float):
+        self.center_x, self.center_y, self.radius = center_x, center_y, radius
+
+    def contains(self, x, y, shape):
+        return (x - self.center_x) ** 2 + (y - self.center_y) ** 2 <= self.radius ** 2
+
+
+class EdgeDistance(Zone):
+    """Cells fewer than distance cells away from the edge of the world"""
+
+    def __init__(self, distance: int):
+        self.distance = distance
+
+    def contains(self, x, y, shape):
+        height, width = shape
+        return np.minimum(np.minimum(x, width - 1 - x), np.minimum(y, height - 1 - y)) < self.distance
+
+
+class ImageMask(Zone):
+    """Cells set in a mask file, a PNG image (dark pixels) or a NPY array (nonzero values),
+    scaled to the world"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mask = None
+
+    def contains(self, x, y, shape):
+        if self._mask is None:
+            from barriers import read_mask
+            self._mask = read_mask(self.path)
+        mask = self._mask
+        height, width = shape
+        return np.asarray(mask[y * mask.shape[0] // height, x * mask.shape[1] // width], dtype=bool)
+
+
+class Function(Zone):
+    """Cells where function(x, y) is true, function taking and returning arrays"""
+
+    def __init__(self, function):
+        self.function = function
+
+    def contains(self, x, y, shape):
+        return self.function(x, y)
+
+
+class Union(Zone):
+    def __init__(self, *zones: Zone):
+        self.zones = zones
+
+    def contains(self, x, y, shape):
+        return functools.reduce(np.logical_or, (zone.contains(x, y, shape) for zone in self.zones))
+
+
+class Intersection(Zone):
+    def __init__(self, *zones: Zone):
+        self.zones = zones
+
+    def contains(self, x, y, shape):
+        return functools.reduce(np.logical_and, (zone.contains(x, y, shape) for zone in self.zones))
+
+
+class Outside(Zone):
+    def __init__(self, zone: Zone):
+        self.zone = zone
+
+    def contains(self, x, y, shape):
+        return ~np.asarray(self.zone.contains(x, y, shape), dtype=bool)
+
+
+class _Scaled(Zone):
+    # A zone built for the size of the world it is compiled for, by function((height, width)) -> Zone
+    def __init__(self, build):
+        self.build = build
+
+    def contains(self, x, y, shape):
+        return self.build(shape).contains(x, y, shape)
+
+
+# Named survival zones for SURVIVAL_ZONE in constants, sized to the world
+PRESETS = {
+    "corner": Rectangle(0, 0, 30, 30),
+    "left": _Scaled(lambda shape: Rectangle(0, 0, shape[1] // 8, shape[0])),
+    "right": _Scaled(lambda shape: Rectangle(shape[1] - shape[1] // 8, 0, shape[1], shape[0])),
+    "center": _Scaled(lambda shape: Circle(shape[1] / 2, shape[0] / 2, min(shape) / 4)),
+    "edges": _Scaled(lambda shape: EdgeDistance(max(1, min(shape) // 20))),
+}
+
+
+def zone(name: str) -> Zone:
+    """The zone of a SURVIVAL_ZONE setting: a name in PRESETS or the path of a mask file"""
+    if name in PRESETS:
+        return PRESETS[name]
+    return _mask_zone(name)
+
+
+@functools.lru_cache(maxsize=8)
+def _mask_zone(path: str) -> Zone:
+    # One ImageMask per path, so its compiled mask is cached too
+    return ImageMask(path)
+
+
+def survivors(pos_x: np.ndarray, pos_y: np.ndarray) -> np.ndarray:
+    """Mask of the organisms that survive the generation: check_survival in constants when it
+    is set, otherwise the SURVIVAL_ZONE compiled for the world"""
+    if con.check_survival is not None:
+        return np.asarray(con.check_survival(pos_x, pos_y), dtype=bool)
+    return zone(con.SURVIVAL_ZONE).compile((con.DIM_Y, con.DIM_X))(pos_x, pos_y)
@@ -0,0 +1,98 @@
+import os
+import queue
+import threading
+import numpy as np
+import constants as con
+import profiling
+
+
+class RecordingPolicy:
+    """Which steps of which generations end up in the video and as PNG snapshots.
+
+    A generation is recorded when its index is in generations, or, when generations is None,
+    when it is a multiple of generation_stride. Within a recorded generation every
+    frame_stride-th step is encoded, and the first and last steps are saved to snapshot_dir
+    unless it is None.
+    """
+
+    def __init__(self, frame_stride: int = None, generation_stride: int = None, generations=None, snapshot_dir: str = None):
+        self.frame_stride = frame_stride or con.VIDEO_FRAME_STRIDE
+        self.generation_stride = generation_stride or con.VIDEO_GENERATION_STRIDE
+        self.generations = set(generations) if generations is not None else None
+        self.snapshot_dir = snapshot_dir if snapshot_dir is not None else con.SNAPSHOT_DIR
+
+    def records_generation(self, gen: int) -> bool:
+        if self.generations is not None:
+            return gen in self.generations
+        return gen % self.generation_stride == 0
+
+    def records_frame(self, gen: int, step: int) -> bool:
+        return self.records_generation(gen) and step % self.frame_stride == 0
+
+    def snapshot_path(self, gen: int, step: int, last: bool = None):
+        """Where to save the snapshot of this step, None if it gets none; last tells whether the
+        generation ends with this step, by default when it is step STEPS_PER_GEN - 1"""
+        if self.snapshot_dir is None or not self.records_generation(gen):
+            return None
+        if last is None:
+            last = step == con.STEPS_PER_GEN - 1
+        if step != 0 and not last:
+            return None
+        return os.path.join(self.snapshot_dir, f"world_{gen}_{step}.png")
+
+
+class AsyncVideoWriter:
+    """Encodes frames and writes snapshots on a background thread.
+
+    Frames go through a bounded queue, so the simulation blocks once the encoder falls
+    queue_size frames behind instead of buffering without limit. OpenCV releases the GIL
+    while encoding, so simulation and encoding run on separate cores.
+    """
+
+    def __init__(self, path: str, fps: int, size: tuple[int, int], queue_size: int = None):
+        import cv2
+        self._cv2 = cv2
+        self._video = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"avc1"), fps, size)
+        self._queue = queue.Queue(maxsize=queue_size or con.VIDEO_QUEUE_SIZE)
+        self._error = None
+        self._worker = threading.Thread(target=self._run, name="video-encoder", daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                path, frame = item
+                with profiling.phase("encode"):
+                    if path is None:
+                        self._video.write(frame)
+                    else:
+                        self._cv2.imwrite(path, frame)
+            except Exception as error:
+                self._error = error
+
+    def _put(self, item):
+        if self._error is not None:
+            raise RuntimeError("Video encoding failed") from self._error
+        # Waiting here means the encoder is the bottleneck
+        with profiling.phase("video_queue"):
+            self._queue.put(item)
+
+    def write(self, frame: np.ndarray):
+        """Queue a BGR frame; it is copied, so the caller may reuse its buffer"""
+        self._put((None, frame.copy()))
+
+    def snapshot(self, path: str, frame: np.ndarray):
+        """Queue a BGR frame to be saved as an image file"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._put((path, frame.copy()))
+
+    def close(self):
+        """Wait for every queued frame to be written and release the video file"""
+        self._queue.put(None)
+        self._worker.join()
+        self._video.release()
+        if self._error is not None:
+            raise RuntimeError("Video encoding failed") from self._error
@@ -1,112 +1,256 @@
-import random
+import time
 from organism import Organism
-import utils
-import cv2
+from population import Population
+from brain import ACTION
+from sensing import compute_sensors
+from genome import random_genomes
+from breeding import breed
+from checkpoint import save_checkpoint
+from grid import ChunkedGrid, new_grid
+import barriers
+from rng import RandomStreams
+from survival import survivors
+from convergence import StagnationMonitor
+import profiling
+import stats
+import replay
 import constants as con
 import numpy as np
 
 def initialize_environment():
     #Setup the initial environment
-    con.WORLD_MATRIX = [[0 for _ in range(con.DIM_X)] for _ in range(con.DIM_Y)]
+    con.WORLD_MATRIX = new_grid((con.DIM_Y, con.DIM_X))
+    con.POPULATION = None
+    con.RANDOM_STREAMS = RandomStreams(con.SEED)
+    barriers.install(con.WORLD_MATRIX, barriers.build_barriers((con.DIM_Y, con.DIM_X)))
     con.SIMULATION_STEP = 0
 
-def populate_creatures(population: list[Organism] = []):
-    #Populate the world with creatures from the given population or with random genomes if population is empty
-    if len(population) == 0:
-        for _ in range(con.POP_SIZE):
-            x, y = random.randrange(con.DIM_X), random.randrange(con.DIM_Y)
-            #print("X is "+str(x)+"Y is "+str(y))
-            while con.WORLD_MATRIX[y][x] != 0:
-                x, y = random.randrange(con.DIM_X), random.randrange(con.DIM_Y)
-            con.WORLD_MATRIX[y][x] = Organism(utils.create_random_dna_sequence(), x, y)
-    else:
-        for organism in population:
-            x, y = random.randrange(con.DIM_X), random.randrange(con.DIM_Y)
-            while con.WORLD_MATRIX[y][x] != 0:
-                x, y = random.randrange(con.DIM_X), random.randrange(con.DIM_Y)
-            con.WORLD_MATRIX[y][x] = organism
-            organism.x = x
-            organism.y = y
+def random_free_cells(count: int) -> tuple[np.ndarray, np.ndarray]:
+    #(x, y) of count distinct random free cells, the start of a random permutation of them
+    #drawn without retrying or building the whole permutation
+    ranks = con.RANDOM_STREAMS.free_cells(count, con.BARRIER_MAP.free_count)
+    return con.BARRIER_MAP.free_cell(ranks)
+
+def populate_creatures(genomes: np.ndarray = None):
+    #Populate the world with creatures from the given genome matrix or with random genomes if none are given,
+    #replacing the creatures already in the world
+    if genomes is None or len(genomes) == 0:
+        genomes = random_genomes(con.POP_SIZE, con.RANDOM_STREAMS.breeding)
+    if con.POPULATION is not None:
+        con.WORLD_MATRIX[con.POPULATION.pos_y, con.POPULATION.pos_x] = con.EMPTY_CELL
+    pos_x, pos_y = random_free_cells(len(genomes))
+    con.POPULATION = Population(genomes, pos_x, pos_y)
+    con.POPULATION.place(con.WORLD_MATRIX)
+
+def population_size() -> int:
+    #Number of creatures in the world
+    return 0 if con.POPULATION is None else len(con.POPULATION)
 
 def get_creature_population() -> list[Organism]:
     #Retrieve the list of creatures in the world
-    return [
-        con.WORLD_MATRIX[y][x]
-        for y in range(con.DIM_Y)
-        for x in range(con.DIM_X)
-        if type(con.WORLD_MATRIX[y][x]) == Organism
-    ]
+    if con.POPULATION is None:
+        return []
+    return list(con.POPULATION.organisms)
+
+def draw_step_uniforms(count: int) -> np.ndarray:
+    #Draw the uniform numbers of one step as a (6, count) matrix: the RANDOM sensor, the random move on x and y,
+    #the move probability checks on x and y, and the priority that breaks ties over a target cell
+    return con.RANDOM_STREAMS.uniforms(6, count)
+
+def decide_moves(population: Population, actions: np.ndarray, uniforms: np.ndarray, rows: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+    #Turn the (rows, action) matrix of the compiled brains into moves, mirroring Organism.perform_actions,
+    #with the step's draws for the rows in uniforms
+    rows = np.arange(len(population)) if rows is None else rows
+    has_action = population.brains.has_action[population.brains.brain[rows]]
+    has = {name: has_action[:, i] for i, name in enumerate(ACTION)}
+    output = {name: actions[:, i] for i, name in enumerate(ACTION)}
+    dir_x, dir_y = population.dir_x[rows], population.dir_y[rows]
+
+    delta_x = np.where(has["MOVE_DIR_X"], output["MOVE_DIR_X"], 0) + has["MOVE_FWD"] * dir_x - has["MOVE_LR"] * dir_y
+    delta_y = np.where(has["MOVE_DIR_Y"], output["MOVE_DIR_Y"], 0) + has["MOVE_FWD"] * dir_y + has["MOVE_LR"] * dir_x
+    # Only move randomly if the action neuron is activated
+    move_rand = has["MOVE_RAND"] & (output["MOVE_RAND"] > 0)
+    delta_x = delta_x + move_rand * (uniforms[1] * 2 - 1)
+    delta_y = delta_y + move_rand * (uniforms[2] * 2 - 1)
+    set_osc = has["SET_OSC_PERIOD"]
+    population.oscillator_period[rows[set_osc]] = 2.5 + np.exp(3 * (np.tanh(output["SET_OSC_PERIOD"][set_osc]) + 1))
+
+    delta_x, delta_y = np.tanh(delta_x), np.tanh(delta_y)  # Turn into a probability (from 0 to 1)
+    move_x = (uniforms[3] < np.abs(delta_x)) * np.where(delta_x < 0, -1, 1)
+    move_y = (uniforms[4] < np.abs(delta_y)) * np.where(delta_y < 0, -1, 1)
+    return move_x.astype(np.int8), move_y.astype(np.int8)
+
+def resolve_moves(population: Population, move_x: np.ndarray, move_y: np.ndarray, priority: np.ndarray) -> tuple[np.ndarray, ...]:
+    #Resolve every move against the grid at the start of the step, returning the organisms that move and their targets:
+    #a target must be inside the world and empty, and the highest priority wins a cell several organisms target
+    movers = np.flatnonzero((move_x != 0) | (move_y != 0))
+    target_x = population.pos_x[movers] + move_x[movers]
+    target_y = population.pos_y[movers] + move_y[movers]
+    inside = (target_x >= 0) & (target_x < con.DIM_X) & (target_y >= 0) & (target_y < con.DIM_Y)
+    movers, target_x, target_y = movers[inside], target_x[inside], target_y[inside]
+    free = con.WORLD_MATRIX[target_y, target_x] == con.EMPTY_CELL
+    movers, target_x, target_y = movers[free], target_x[free], target_y[free]
+
+    #Sort by target cell, highest priority first, and keep the first organism of every cell
+    target = target_y.astype(np.int64) * con.DIM_X + target_x
+    order = np.lexsort((-priority[movers], target))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = target[order[1:]] != target[order[:-1]]
+    winners = order[first]
+    return movers[winners], target_x[winners], target_y[winners]
+
+def apply_moves(population: Population, move_x: np.ndarray, move_y: np.ndarray, priority: np.ndarray):
+    #Move the organisms by their (move_x, move_y) in two phases, resolving every move and then updating the grid,
+    #positions and facing directions in bulk, so the order they are stored in does not matter
+    movers, target_x, target_y = resolve_moves(population, move_x, move_y, priority)
+    con.WORLD_MATRIX[population.pos_y[movers], population.pos_x[movers]] = con.EMPTY_CELL
+    con.WORLD_MATRIX[target_y, target_x] = movers.astype(np.int32)
+    population.pos_x[movers], population.pos_y[movers] = target_x, target_y
+    #Organisms face the way they last moved
+    population.dir_x[movers], population.dir_y[movers] = move_x[movers], move_y[movers]
+
+def perform_population_actions(population: Population, actions: np.ndarray, uniforms: np.ndarray = None):
+    #Apply the (population, action) matrix of the compiled brains, mirroring Organism.perform_actions
+    if uniforms is None:
+        uniforms = draw_step_uniforms(len(population))
+    apply_moves(population, *decide_moves(population, actions, uniforms), uniforms[5])
 
 def simulate_world():
     #Simulate the world by calculating Organism actions and executing them
-    for y in range(con.DIM_Y):
-        for x in range(con.DIM_X):
-            if type(con.WORLD_MATRIX[y][x]) == Organism:
-                con.WORLD_MATRIX[y][x].process_brain()
-                con.WORLD_MATRIX[y][x].perform_actions()
+    population = con.POPULATION
+    profiler = profiling.active()
+    started = time.perf_counter_ns() if profiler is not None else 0
+    if population is not None:
+        old_x, old_y = population.pos_x.copy(), population.pos_y.copy()
+    if population is not None and con.WORKERS > 1 and population.brains is not None and isinstance(con.WORLD_MATRIX, np.ndarray):
+        from parallel import parallel_engine
+        parallel_engine().step(population)
+    elif population is not None:
+        if population.brains is not None:
+            with profiling.phase("sense"):
+                uniforms = draw_step_uniforms(len(population))
+                brains = population.brains
+                sensors = compute_sensors(population, con.WORLD_MATRIX, brains.uses_sensor[brains.brain], random_values=uniforms[0])
+            with profiling.phase("think"):
+                actions = population.brains.evaluate(sensors)
+            with profiling.phase("act"):
+                perform_population_actions(population, actions, uniforms)
+        else:
+            with profiling.phase("graph_brains"):
+                population.uniforms = draw_step_uniforms(len(population))
+                moves = np.zeros((2, len(population)), dtype=np.int8)
+                for organism in population.organisms:
+                    organism.process_brain()
+                    moves[:, organism.index] = organism.perform_actions()
+            with profiling.phase("act"):
+                apply_moves(population, moves[0], moves[1], population.uniforms[5])
+                population.uniforms = None
     con.SIMULATION_STEP += 1
+    if profiler is not None and population is not None:
+        profiler.step(len(population), time.perf_counter_ns() - started)
+    if stats.active() is not None and population is not None:
+        moved = int(np.count_nonzero((old_x != population.pos_x) | (old_y != population.pos_y)))
+        stats.active().record_step(moved, len(population))
+    if replay.active() is not None and population is not None:
+        replay.active().record_step(population.pos_x - old_x, population.pos_y - old_y)
+
+def simulate_generation():
+    #Run the steps of one generation, yielding (step, last) after each with last true at its final step:
+    #after STEPS_PER_GEN steps, or earlier once the population stagnates (see STAGNATION_STEPS)
+    monitor = StagnationMonitor(con.POPULATION)
+    for step in range(con.STEPS_PER_GEN):
+        simulate_world()
+        stagnated = step + 1 < con.STEPS_PER_GEN and monitor.stagnated(step + 1)
+        if stagnated:
+            stats.stopped_early()
+        yield step, stagnated or step + 1 == con.STEPS_PER_GEN
+        if stagnated:
+            return
 
 def filter_surviving_creatures():
     #Remove creatures that do not meet the survival criteria
-    for y in range(con.DIM_Y):
-        for x in range(con.DIM_X):
-            if type(con.WORLD_MATRIX[y][x]) == Organism:
-                if not con.check_survival(x, y):
-                    con.WORLD_MATRIX[y][x] = 0
-
-def breed_next_generation():
-    #Generate the next generation by breeding creatures from the current population
-    population = get_creature_population()
-    next_gen = []
-    for _ in range(con.POP_SIZE):
-        parents = [
-            bin(int(p.dna.replace(" ", ""), 16))[2:].zfill(
-                con.LENGTH_GENE * con.LENGTH_GENOME * 4
-            )
-            for p in random.sample(population, k=2)
-        ]
-        crossover_point = random.randrange(1, con.LENGTH_GENOME * con.LENGTH_GENE * 4)
-
-        child = parents[0][:crossover_point] + parents[1][crossover_point:]
-        child = "".join(
-            [
-                str(int(bool(int(b)) != (random.random() < con.MUTATION_RATE)))
-                for b in child
-            ]
+    if con.POPULATION is not None:
+        population = con.POPULATION
+        with profiling.phase("survival"):
+            population.keep(survivors(population.pos_x, population.pos_y), con.WORLD_MATRIX)
+            if isinstance(con.WORLD_MATRIX, ChunkedGrid):
+                con.WORLD_MATRIX.compact()
+
+def breed_next_generation(fitness: np.ndarray = None):
+    #Generate the next generation by breeding creatures from the current population,
+    #weighted by fitness (con.fitness of the survivors by default)
+    population = con.POPULATION
+    with profiling.phase("breed"):
+        if fitness is None and con.fitness is not None:
+            fitness = con.fitness(population.pos_x, population.pos_y)
+        next_gen = breed(
+            population.genomes[population.genome], con.POP_SIZE, fitness, con.SELECTION_STRATEGY, con.RANDOM_STREAMS.breeding
         )
-        child = [
-            child[i : i + con.LENGTH_GENE * 4]
-            for i in range(0, con.LENGTH_GENOME * con.LENGTH_GENE * 4, con.LENGTH_GENE* 4)
-        ]
-        child = " ".join([hex(int(i, 2))[2:].zfill(con.LENGTH_GENOME) for i in child])
-
-        x, y = random.randrange(con.DIM_X), random.randrange(con.DIM_Y)
-            #print("X is "+str(x)+"Y is "+str(y))
-        while con.WORLD_MATRIX[y][x] != 0:
-            x, y = random.randrange(con.DIM_X), random.randrange(con.DIM_Y)
-
-        next_gen.append(Organism(child,x,y))
-
-    populate_creatures(next_gen)
-
-def record_simulation_video(path: str = "videos/simulation.mp4"):
-    #Record a video of the simulation and save it to the specified path
-    fourcc = cv2.VideoWriter_fourcc(*"avc1")
-    video = cv2.VideoWriter(path, fourcc, 30, (con.IMG_WIDTH, con.IMG_HEIGHT))
-
-    for gen in range(con.TOTAL_GENS):
-        if len(get_creature_population()) < 1:
-            populate_creatures()
-        elif len(get_creature_population()) > 2:
-            breed_next_generation()
-
-        for i in range(con.STEPS_PER_GEN):
-            simulate_world()
-            if i == 0 or i == con.STEPS_PER_GEN-1: 
-                utils.render_world_snapshot(str(gen)+"_"+str(i))
-            video.write(cv2.cvtColor(np.array(utils.render_world_snapshot()), cv2.COLOR_RGB2BGR))
+        # The children replace the surviving parents in the world, the barriers stay
+        populate_creatures(next_gen)
+
+def start_generation():
+    #Fill the world for the next generation: breed the survivors, or start over from random genomes when none are left
+    if population_size() < 1:
+        populate_creatures()
+    elif population_size() > 2:
+        breed_next_generation()
+    stats.begin_generation(con.POPULATION)
+    replay.begin_generation(con.POPULATION)
 
+def run_headless(first_generation: int = 0, checkpoint_path: str = None, report=print):
+    #Run the generations without drawing anything and report a one line summary of each,
+    #saving the world to checkpoint_path after every generation
+    for gen in range(first_generation, con.TOTAL_GENS):
+        started = time.perf_counter()
+        start_generation()
+        placed = population_size()
+        steps = sum(1 for _ in simulate_generation())
         filter_surviving_creatures()
+        survivors = population_size()
+        elapsed = time.perf_counter() - started
+        report(
+            f"gen {gen}: {survivors}/{placed} survived ({survivors / max(placed, 1):.1%}), "
+            f"{elapsed:.2f}s, {steps / elapsed:.0f} steps/s"
+            + (f", stagnated after {steps} steps" if steps < con.STEPS_PER_GEN else "")
+        )
+        profiling.end_generation(gen)
+        stats.end_generation(gen, survivors)
+        replay.end_generation(gen, survivors)
+        if checkpoint_path is not None:
+            save_checkpoint(checkpoint_path, gen + 1)
+
+def record_simulation_video(path: str = "videos/simulation.mp4", policy: "RecordingPolicy" = None, checkpoint_path: str = None, first_generation: int = 0):
+    #Record a video of the simulation and save it to the specified path, encoding on a background thread,
+    #saving the world to checkpoint_path after every generation
+    from render import Renderer
+    from video import AsyncVideoWriter, RecordingPolicy
+    policy = policy or RecordingPolicy()
+    video = AsyncVideoWriter(path, con.VIDEO_FPS, (con.IMG_WIDTH, con.IMG_HEIGHT))
+    renderer = Renderer(channels="BGR")
+
+    try:
+        for gen in range(first_generation, con.TOTAL_GENS):
+            start_generation()
+
+            for i, last in simulate_generation():
+                snapshot_path = policy.snapshot_path(gen, i, last)
+                if snapshot_path is None and not policy.records_frame(gen, i):
+                    continue
+                # Frames are only rendered when something is going to be written
+                with profiling.phase("render"):
+                    frame = renderer.render(con.POPULATION, con.WORLD_MATRIX)
+                if snapshot_path is not None:
+                    video.snapshot(snapshot_path, frame)
+                if policy.records_frame(gen, i):
+                    video.write(frame)
 
-    print("Saving simulation video")
-    video.release()
+            filter_surviving_creatures()
+            profiling.end_generation(gen)
+            stats.end_generation(gen, population_size())
+            replay.end_generation(gen, population_size())
+            if checkpoint_path is not None:
+                save_checkpoint(checkpoint_path, gen + 1)
+    finally:
+        print("Saving simulation video")
+        video.close()